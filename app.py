@@ -9,15 +9,35 @@ import requests
 import xml.etree.ElementTree as ET
 import time
 import json
-from bs4 import BeautifulSoup
+import asyncio
+import base64
+from bs4 import BeautifulSoup, FeatureNotFound
 from bs4.element import Tag
 from bs4 import NavigableString
 import re
-from urllib.parse import urljoin, urlparse, quote_plus
-from typing import cast  # added
+import hashlib
+import hmac
+import logging
+import math
+import pickle
+import queue
+import sqlite3
+import tempfile
+import zlib
+from urllib.parse import urldefrag, urljoin, urlparse, quote_plus
+from email.utils import parsedate_to_datetime
+from typing import Callable, cast  # added
 import os
+import random
+import sys
 import threading
-from collections import deque, OrderedDict
+import uuid
+from collections import Counter, deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from contextlib import asynccontextmanager, closing, contextmanager
+from functools import partial
+from logging.handlers import RotatingFileHandler
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
@@ -49,16 +69,878 @@ def get_system_prompt() -> dict:
     prompt = _load_sysprompt_file()
     return {"prompt": prompt, "version": "1.3"}
 
+# ------------------------------------------------------------------
+# Metrics (Prometheus text exposition, served at /metrics)
+# ------------------------------------------------------------------
+
+_METRICS_MAX_HOSTS = int(os.getenv("WEBTOOL_METRICS_MAX_HOSTS", "50"))  # distinct host labels before folding into "other"
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Metrics:
+    """Counters, gauges and histograms kept in process and rendered in the Prometheus text format.
+
+    Families are declared once with describe(); samples are keyed by their sorted
+    label pairs. Values derived from existing stats (cache sizes, pool occupancy)
+    are not stored here but added at scrape time by _render_metrics.
+    """
+
+    def __init__(self, max_hosts: int):
+        self.max_hosts = max_hosts
+        self._lock = threading.Lock()
+        self._families: dict[str, tuple[str, str, tuple[float, ...]]] = {}
+        self._values: dict[str, dict[tuple, object]] = {}
+        self._hosts: set[str] = set()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple[float, ...] = ()):
+        self._families[name] = (kind, help_text, buckets)
+        self._values.setdefault(name, {})
+
+    def host_label(self, host: str) -> str:
+        """Bound label cardinality: the first max_hosts hosts keep their name, the rest become 'other'."""
+        with self._lock:
+            if host in self._hosts:
+                return host
+            if len(self._hosts) < self.max_hosts:
+                self._hosts.add(host)
+                return host
+        return "other"
+
+    def inc(self, name: str, n: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + n
+
+    def add(self, name: str, n: float, **labels):
+        """Gauge delta (e.g. +1 / -1 around an in-flight call)."""
+        self.inc(name, n, **labels)
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._families[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def render(self, extra: list[tuple[str, str, str, list[tuple[dict, float]]]] = ()) -> str:
+        """Exposition text for the stored families plus extra (name, kind, help, [(labels, value)])."""
+        lines = []
+        with self._lock:
+            snapshot = [(name, *self._families[name], dict(series)) for name, series in self._values.items()]
+        for name, kind, help_text, buckets, series in snapshot:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series.items()):
+                labels = dict(key)
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                for bound, n in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {n}")
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for name, kind, help_text, samples in extra:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{k}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+_metrics = _Metrics(_METRICS_MAX_HOSTS)
+_metrics.describe("webtool_tool_calls_total", "counter", "Tool calls by tool and outcome (ok / error).")
+_metrics.describe("webtool_tool_duration_seconds", "histogram", "Wall time of tool calls.", _LATENCY_BUCKETS)
+_metrics.describe("webtool_tool_calls_in_flight", "gauge", "Tool calls currently executing.")
+_metrics.describe("webtool_upstream_requests_total", "counter", "Upstream HTTP attempts by host and status class (2xx..5xx, error).")
+_metrics.describe("webtool_upstream_duration_seconds", "histogram", "Upstream time to response headers per host.", _LATENCY_BUCKETS)
+_metrics.describe("webtool_upstream_bytes_total", "counter", "Response body bytes downloaded per host.")
+_metrics.describe("webtool_upstream_throttled_total", "counter", "Upstream requests refused by the per-host rate / concurrency limits.")
+_metrics.describe("webtool_search_duration_seconds", "histogram", "Search engine latency, including search-cache hits.", _LATENCY_BUCKETS)
+_metrics.describe("webtool_parse_duration_seconds", "histogram", "Time to parse a page into the page model (cache misses only).", _PARSE_BUCKETS)
+
+
+@contextmanager
+def _track_tool(tool: str):
+    """Count, time and gauge one tool call; the block sets outcome[0] to 'error' on a failed result."""
+    outcome = ["ok"]
+    _metrics.add("webtool_tool_calls_in_flight", 1, tool=tool)
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException:
+        outcome[0] = "error"
+        raise
+    finally:
+        _metrics.add("webtool_tool_calls_in_flight", -1, tool=tool)
+        _metrics.observe("webtool_tool_duration_seconds", time.perf_counter() - start, tool=tool)
+        _metrics.inc("webtool_tool_calls_total", tool=tool, status=outcome[0])
+
+
+def _observe_upstream(host: str, start: float, status: int | None):
+    """Record one upstream attempt that started at perf_counter() value start and just got headers (or failed)."""
+    seconds = time.perf_counter() - start
+    label = _metrics.host_label(host)
+    _metrics.inc("webtool_upstream_requests_total", host=label, status=f"{status // 100}xx" if status else "error")
+    _metrics.observe("webtool_upstream_duration_seconds", seconds, host=label)
+    _add_span("upstream", start, seconds, host=host, status=status)
+
+# ------------------------------------------------------------------
+# Tracing (per-request phase spans, JSONL export, sampling profiler)
+# ------------------------------------------------------------------
+
+_TRACE_FILE = os.getenv("WEBTOOL_TRACE_FILE", "")  # JSONL span export; "" = off
+_TRACE_FILE_BYTES = int(os.getenv("WEBTOOL_TRACE_FILE_BYTES", str(10 * 1024 * 1024)))  # rotate after this size
+_TRACE_FILE_BACKUPS = int(os.getenv("WEBTOOL_TRACE_FILE_BACKUPS", "3"))
+_TRACE_SAMPLE = float(os.getenv("WEBTOOL_TRACE_SAMPLE", "1"))  # fraction of requests exported
+_TRACE_META = os.getenv("WEBTOOL_TRACE_META", "0") == "1"  # timings: line in every fetch_url META
+_ADMIN_TOKEN = os.getenv("WEBTOOL_ADMIN_TOKEN", "")  # enables /admin/profile; "" = disabled
+_PROFILE_DIR = os.getenv("WEBTOOL_PROFILE_DIR", tempfile.gettempdir())
+_PROFILE_MAX_SECONDS = float(os.getenv("WEBTOOL_PROFILE_MAX_SECONDS", "120"))
+_PROFILE_INTERVAL = float(os.getenv("WEBTOOL_PROFILE_INTERVAL", "0.005"))  # seconds between samples
+
+
+class _Trace:
+    """Spans of one incoming request; shared by the threads working on it (batch entries, fan-out)."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, **attrs):
+        span = {"name": name, "start_ms": round((start - self.start) * 1000, 3), "ms": round(duration * 1000, 3), **attrs}
+        with self._lock:
+            self.spans.append(span)
+
+    def record(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.id,
+            "kind": self.kind,
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.wall)),
+            "ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "spans": spans,
+        }
+
+
+_trace_local = threading.local()  # .trace (current _Trace), .phases / .tool_start (current tool call, for META)
+
+
+def _add_span(name: str, start: float, duration: float, **attrs):
+    """Record a span measured by the caller (start is a perf_counter value)."""
+    trace = getattr(_trace_local, "trace", None)
+    if trace is not None:
+        trace.add(name, start, duration, **attrs)
+    phases = getattr(_trace_local, "phases", None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + duration
+
+
+@contextmanager
+def _span(name: str, **attrs):
+    """Time the block as a phase of the current request (no-op outside a traced request)."""
+    if getattr(_trace_local, "trace", None) is None and getattr(_trace_local, "phases", None) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_span(name, start, time.perf_counter() - start, **attrs)
+
+
+@contextmanager
+def _trace_bind(trace: "_Trace | None"):
+    """Make trace current on this thread (worker threads of a traced request)."""
+    previous = getattr(_trace_local, "trace", None)
+    _trace_local.trace = trace
+    try:
+        yield trace
+    finally:
+        _trace_local.trace = previous
+
+
+def _run_traced(trace: "_Trace | None", fn: Callable[[], object]):
+    with _trace_bind(trace):
+        return fn()
+
+
+@contextmanager
+def _trace_request(kind: str):
+    """Trace one incoming request on this thread and export it when done; nested calls join the outer trace."""
+    current = getattr(_trace_local, "trace", None)
+    if current is not None:
+        yield current
+        return
+    trace = _Trace(kind)
+    try:
+        with _trace_bind(trace):
+            yield trace
+    finally:
+        _export_trace(trace)
+
+
+@contextmanager
+def _tool_phases():
+    """Collect per-phase totals of the tool call running on this thread (read by _timings_line)."""
+    previous = (getattr(_trace_local, "phases", None), getattr(_trace_local, "tool_start", None))
+    _trace_local.phases, _trace_local.tool_start = {}, time.perf_counter()
+    try:
+        yield
+    finally:
+        _trace_local.phases, _trace_local.tool_start = previous
+
+
+def _timings_line() -> str | None:
+    """`timings: total=..ms upstream=..ms ...` for the current tool call so far."""
+    phases = getattr(_trace_local, "phases", None)
+    if phases is None:
+        return None
+    parts = [f"total={(time.perf_counter() - _trace_local.tool_start) * 1000:.0f}ms"]
+    parts += [f"{name}={seconds * 1000:.0f}ms" for name, seconds in phases.items()]
+    return "timings: " + " ".join(parts)
+
+
+def _build_trace_logger() -> "logging.Logger | None":
+    if not _TRACE_FILE:
+        return None
+    handler = RotatingFileHandler(_TRACE_FILE, maxBytes=_TRACE_FILE_BYTES, backupCount=_TRACE_FILE_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("webtool.trace")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+_trace_logger = _build_trace_logger()
+_trace_lock = threading.Lock()
+_trace_stats = {"exported": 0, "sampled_out": 0}
+
+
+def _export_trace(trace: _Trace):
+    """Append the trace as one JSON line to WEBTOOL_TRACE_FILE (rotated by size)."""
+    if _trace_logger is None or not trace.spans:
+        return
+    sampled = _TRACE_SAMPLE >= 1 or random.random() < _TRACE_SAMPLE
+    if sampled:
+        _trace_logger.info(json.dumps(trace.record(), ensure_ascii=False))
+    with _trace_lock:
+        _trace_stats["exported" if sampled else "sampled_out"] += 1
+
+
+_THREAD_NUMBER_RE = re.compile(r"[-_]?\d+")
+
+
+class _SamplingProfiler:
+    """Samples the stacks of all threads via sys._current_frames() and writes collapsed stacks.
+
+    Output lines are `thread;outer_fn;...;inner_fn count` (flamegraph.pl, speedscope and
+    inferno read this directly). In cpu mode a thread is only sampled when its CPU clock
+    advanced since the previous sample, so threads blocked on sockets or locks drop out;
+    wall mode samples every thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running: dict | None = None
+        self.last: dict | None = None
+
+    def start(self, seconds: float, interval: float, mode: str) -> dict | None:
+        """Start a background profiling run; None when one is already running."""
+        with self._lock:
+            if self.running is not None:
+                return None
+            path = os.path.join(_PROFILE_DIR, f"webtool-profile-{time.strftime('%Y%m%d-%H%M%S')}-{mode}.folded")
+            self.running = {"file": path, "seconds": seconds, "interval": interval, "mode": mode, "started_at": time.time()}
+            info = dict(self.running)
+        threading.Thread(target=self._run, args=(path, seconds, interval, mode), daemon=True, name="webtool-profiler").start()
+        return info
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"running": self.running, "last": self.last}
+
+    def _run(self, path: str, seconds: float, interval: float, mode: str):
+        counts: dict[str, int] = {}
+        cpu_seen: dict[int, float] = {}
+        me = threading.get_ident()
+        samples = 0
+        error = None
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {t.ident: _THREAD_NUMBER_RE.sub("", t.name) for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if mode == "cpu" and not self._used_cpu(ident, cpu_seen):
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    key = ";".join([names.get(ident, "thread")] + stack[::-1])
+                    counts[key] = counts.get(key, 0) + 1
+                samples += 1
+                time.sleep(interval)
+            with open(path, "w", encoding="utf-8") as f:
+                for key, n in sorted(counts.items()):
+                    f.write(f"{key} {n}\n")
+        except Exception as exc:
+            app.logger.exception("profiler run failed")
+            error = str(exc)
+        with self._lock:
+            self.last = {**(self.running or {}), "samples": samples, "stacks": len(counts), "finished_at": time.time()}
+            if error:
+                self.last["error"] = error
+            self.running = None
+
+    @staticmethod
+    def _used_cpu(ident: int, seen: dict[int, float]) -> bool:
+        try:
+            now = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):  # no per-thread CPU clocks here: keep the sample
+            return True
+        previous = seen.get(ident)
+        seen[ident] = now
+        return previous is not None and now > previous
+
+
+_profiler = _SamplingProfiler()
+
+
+def _admin_profile(method: str, authorization: str, args) -> tuple[dict, int]:
+    """Shared /admin/profile logic: GET reports status, POST ?seconds=N&mode=cpu|wall starts a run.
+
+    Disabled (404) unless WEBTOOL_ADMIN_TOKEN is set; requires `Authorization: Bearer <token>`.
+    """
+    if not _ADMIN_TOKEN:
+        return {"error": "not found"}, 404
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), _ADMIN_TOKEN.encode()):
+        return {"error": "forbidden"}, 403
+    if method == "GET":
+        return _profiler.status(), 200
+    try:
+        seconds = float(args.get("seconds", "10"))
+    except (TypeError, ValueError):
+        return {"error": "seconds must be a number"}, 400
+    mode = args.get("mode", "cpu")
+    if mode not in ("cpu", "wall"):
+        return {"error": "mode must be cpu or wall"}, 400
+    seconds = max(0.1, min(seconds, _PROFILE_MAX_SECONDS))
+    info = _profiler.start(seconds, _PROFILE_INTERVAL, mode)
+    if info is None:
+        return {"error": "a profile is already running", **_profiler.status()}, 409
+    return {"status": "started", **info}, 202
+
+# ------------------------------------------------------------------
+# Shared HTTP client (pooled keep-alive connections, retries, UA policy)
+# ------------------------------------------------------------------
+
+_HTTP_USER_AGENT = os.getenv("WEBTOOL_USER_AGENT", "Mozilla/5.0 (compatible; webtool-mcp/1.0; +https://github.com/SashaYerashoff/webtool-mcp)")
+_HTTP_POOL_CONNECTIONS = int(os.getenv("WEBTOOL_HTTP_POOL_CONNECTIONS", "32"))  # distinct hosts kept warm
+_HTTP_POOL_MAXSIZE = int(os.getenv("WEBTOOL_HTTP_POOL_MAXSIZE", "10"))  # keep-alive sockets per host
+_HTTP_POOL_HOSTS = os.getenv("WEBTOOL_HTTP_POOL_HOSTS", "news.google.com=16,en.wikipedia.org=8,www.bing.com=8,duckduckgo.com=8")
+_HTTP_RETRIES = int(os.getenv("WEBTOOL_HTTP_RETRIES", "2"))
+_HTTP_BACKOFF = float(os.getenv("WEBTOOL_HTTP_BACKOFF", "0.3"))  # base seconds, doubled per attempt
+_HTTP_BACKOFF_MAX = float(os.getenv("WEBTOOL_HTTP_BACKOFF_MAX", "4"))
+_HTTP_RETRY_STATUS = {429, 500, 502, 503, 504}
+# Per-host politeness: token bucket (requests/min + burst) and concurrent-request cap for every upstream call.
+_HOST_RATE_PER_MIN = float(os.getenv("WEBTOOL_HOST_RATE_PER_MIN", os.getenv("WEBTOOL_FETCH_URL_RATE_PER_MIN", "60")))  # 0 = unlimited
+_HOST_BURST = int(os.getenv("WEBTOOL_HOST_BURST", "10"))
+_HOST_CONCURRENCY = int(os.getenv("WEBTOOL_HOST_CONCURRENCY", "6"))  # 0 = unlimited
+_HOST_LIMITS = os.getenv("WEBTOOL_HOST_LIMITS", "")  # host=rate/burst/concurrency overrides (on top of the defaults below)
+# Search / feed / reference APIs are called far more often than arbitrary fetch_url origins; their
+# limits match the dedicated pools above. The global 60/min default is meant for unknown sites.
+_HOST_LIMITS_DEFAULT = (
+    "news.google.com=600/60/16,en.wikipedia.org=300/30/8,www.bing.com=300/30/8,"
+    "duckduckgo.com=300/30/8,api.duckduckgo.com=300/30/8,www.googleapis.com=300/30/8"
+)
+_HOST_MAX_WAIT = float(os.getenv("WEBTOOL_HOST_MAX_WAIT", "2"))  # waits up to this long are absorbed, longer ones refused
+
+
+def _parse_host_map(spec: str) -> dict[str, str]:
+    """Parse 'host=value,host2=value2' env settings (blank / malformed items ignored)."""
+    out: dict[str, str] = {}
+    for item in (spec or "").split(","):
+        host, sep, value = item.strip().partition("=")
+        if sep and host.strip() and value.strip():
+            out[host.strip().lower()] = value.strip()
+    return out
+
+
+class UpstreamThrottled(requests.RequestException):
+    """Raised instead of sending a request that would exceed a host's rate or concurrency limit."""
+
+    def __init__(self, host: str, retry_after: float, reason: str):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"upstream host {host} is throttled by webtool ({reason}); retry after {retry_after:.1f}s. Cached pages remain available.")
+
+
+_throttle_local = threading.local()  # .deadline: monotonic time a fan-out task may keep queueing for a slot until
+
+
+class _HostLimiter:
+    """Per-host token buckets plus concurrency slots.
+
+    try_acquire() never blocks so the threaded client (time.sleep) and the asyncio
+    client (asyncio.sleep) share one implementation: it either takes a token and a
+    slot together or returns how long to wait before trying again.
+    """
+
+    _SLOT_POLL = 0.05  # seconds between checks while a host is at its concurrency cap
+
+    def __init__(self, rate_per_min: float, burst: int, concurrency: int, overrides: dict[str, tuple[float, int, int]]):
+        self.default = (rate_per_min, max(1, burst), concurrency)
+        self.overrides = overrides
+        self._lock = threading.Lock()
+        self._hosts: dict[str, list] = {}  # host -> [tokens, last_refill, active]
+
+    def limits(self, host: str) -> tuple[float, int, int]:
+        return self.overrides.get(host, self.default)
+
+    def try_acquire(self, host: str) -> tuple[bool, float, str]:
+        """(acquired, seconds_to_wait, reason)."""
+        rate, burst, concurrency = self.limits(host)
+        now = time.monotonic()
+        with self._lock:
+            state = self._hosts.setdefault(host, [float(burst), now, 0])
+            if rate > 0:
+                state[0] = min(float(burst), state[0] + (now - state[1]) * rate / 60.0)
+            state[1] = now
+            if concurrency > 0 and state[2] >= concurrency:
+                return False, self._SLOT_POLL, f"{concurrency} concurrent requests"
+            if rate > 0 and state[0] < 1.0:
+                return False, (1.0 - state[0]) * 60.0 / rate, f"{rate:g}/min, burst {burst}"
+            if rate > 0:
+                state[0] -= 1.0
+            state[2] += 1
+            return True, 0.0, ""
+
+    def release(self, host: str):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state and state[2] > 0:
+                state[2] -= 1
+
+    def active(self, host: str) -> int:
+        with self._lock:
+            state = self._hosts.get(host)
+            return state[2] if state else 0
+
+
+def _parse_host_limits(spec: str, base: dict[str, tuple[float, int, int]] | None = None) -> dict[str, tuple[float, int, int]]:
+    """'host=rate/burst/concurrency,...' with omitted fields taking the host's entry in base, else the global defaults."""
+    out = {}
+    for host, value in _parse_host_map(spec).items():
+        parts = [p.strip() for p in value.split("/")]
+        fallback = (base or {}).get(host, (_HOST_RATE_PER_MIN, _HOST_BURST, _HOST_CONCURRENCY))
+        try:
+            rate = float(parts[0]) if parts[0] else fallback[0]
+            burst = int(parts[1]) if len(parts) > 1 and parts[1] else fallback[1]
+            concurrency = int(parts[2]) if len(parts) > 2 and parts[2] else fallback[2]
+        except ValueError:
+            continue
+        out[host] = (rate, max(1, burst), concurrency)
+    return out
+
+
+class _HttpClient:
+    """One requests.Session for every upstream call.
+
+    Connections are kept alive in per-host pools (sized per host via
+    WEBTOOL_HTTP_POOL_HOSTS), transient failures (connection errors, timeouts,
+    429/5xx) are retried with full-jitter exponential backoff, and a default
+    User-Agent is applied unless the caller passes its own header. Every attempt
+    first takes a token and a concurrency slot from the host's limiter; waits up to
+    WEBTOOL_HOST_MAX_WAIT are slept through, longer ones raise UpstreamThrottled.
+    Tasks run by _fan_out instead queue until their fan-out deadline.
+    """
+
+    def __init__(self, user_agent: str, pool_connections: int, pool_maxsize: int, host_pools: dict[str, int], retries: int, backoff: float, backoff_max: float, limiter: _HostLimiter | None = None, max_wait: float = 0.0):
+        self.limiter = limiter
+        self.max_wait = max_wait
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        default = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", default)
+        self.session.mount("http://", default)
+        self._adapters: dict[str, HTTPAdapter] = {"*": default}
+        for host, size in host_pools.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.session.mount(f"https://{host}/", adapter)
+            self.session.mount(f"http://{host}/", adapter)
+            self._adapters[host] = adapter
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def count(self, host: str, field: str, n: int = 1):
+        with self._lock:
+            st = self._stats.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+            st[field] = st.get(field, 0) + n
+
+    def backoff_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Full-jitter delay before retry number attempt+1 (honours a numeric Retry-After, capped)."""
+        delay = min(self.backoff_max, self.backoff * (2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = min(self.backoff_max, max(delay, float(retry_after)))
+        return random.uniform(0, delay)
+
+    def _sleep_backoff(self, attempt: int, retry_after: str | None = None):
+        time.sleep(self.backoff_delay(attempt, retry_after))
+
+    def throttle_step(self, host: str, waited: float) -> float:
+        """One non-blocking limiter check: 0 when a slot was taken, else seconds to wait.
+
+        Raises UpstreamThrottled once the wait would exceed max_wait in total, or,
+        inside a _fan_out task, once it would run past the fan-out deadline.
+        """
+        if self.limiter is None:
+            return 0.0
+        acquired, wait, reason = self.limiter.try_acquire(host)
+        if acquired:
+            if waited:
+                self.count(host, "throttle_waits")
+            return 0.0
+        deadline = getattr(_throttle_local, "deadline", None)
+        if waited + wait > self.max_wait and (deadline is None or time.monotonic() + wait > deadline):
+            self.count(host, "throttled")
+            _metrics.inc("webtool_upstream_throttled_total", host=_metrics.host_label(host), reason=reason)
+            raise UpstreamThrottled(host, max(wait, 1.0), reason)
+        return wait
+
+    def acquire(self, host: str):
+        waited = 0.0
+        start = time.perf_counter()
+        while True:
+            wait = self.throttle_step(host, waited)
+            if not wait:
+                if waited:
+                    _add_span("throttle_wait", start, time.perf_counter() - start, host=host)
+                return
+            time.sleep(wait)
+            waited += wait
+
+    def release(self, host: str):
+        if self.limiter is not None:
+            self.limiter.release(host)
+
+    @contextmanager
+    def throttle(self, host: str):
+        """Hold a rate/concurrency slot of `host` for upstream calls made outside get() (e.g. third-party clients)."""
+        self.acquire(host)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(host)
+            _metrics.observe("webtool_upstream_duration_seconds", time.perf_counter() - start, host=_metrics.host_label(host))
+
+    def get(self, url: str, params: dict | None = None, timeout: float = 10, headers: dict | None = None, stream: bool = False) -> requests.Response:
+        """GET with pooled connections and retries. Raises requests.RequestException like requests.get."""
+        host = (urlparse(url).hostname or "").lower()
+        attempt = 0
+        while True:
+            self.acquire(host)
+            self.count(host, "requests")
+            start = time.perf_counter()
+            try:
+                resp = self.session.get(url, params=params, timeout=timeout, headers=headers, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                _observe_upstream(host, start, None)
+                self.release(host)
+                if attempt >= self.retries:
+                    self.count(host, "errors")
+                    raise
+                self.count(host, "retries")
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+            except BaseException:
+                self.release(host)
+                raise
+            _observe_upstream(host, start, resp.status_code)
+            if resp.status_code in _HTTP_RETRY_STATUS and attempt < self.retries:
+                retry_after = resp.headers.get("Retry-After")
+                resp.close()
+                self.release(host)
+                self.count(host, "retries")
+                self._sleep_backoff(attempt, retry_after)
+                attempt += 1
+                continue
+            if resp.status_code >= 400:
+                self.count(host, "errors")
+            if stream:
+                self._release_on_close(resp, host)  # the body is still being read from the origin
+            else:
+                self.release(host)
+                _metrics.inc("webtool_upstream_bytes_total", len(resp.content), host=_metrics.host_label(host))
+            return resp
+
+    def _release_on_close(self, resp: requests.Response, host: str):
+        close = resp.close
+        released = []
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self.release(host)
+
+        resp.close = close_and_release
+
+    @staticmethod
+    def _open_pools(adapter: HTTPAdapter) -> list:
+        """(key, pool) pairs currently held by an adapter's urllib3 PoolManager.
+
+        urllib3 has no public listing, so this peeks at its LRU container; when a
+        urllib3 release lays it out differently the pool fields are simply omitted.
+        """
+        container = getattr(getattr(getattr(adapter, "poolmanager", None), "pools", None), "_container", None)
+        try:
+            return list(container.items()) if container is not None else []
+        except (AttributeError, TypeError, RuntimeError):
+            return []
+
+    def stats(self) -> dict:
+        """Per-host request counters plus live pool occupancy (connections opened vs requests served)."""
+        with self._lock:
+            out = {host: dict(st) for host, st in self._stats.items()}
+        for name, adapter in self._adapters.items():
+            for pool_key, pool in self._open_pools(adapter):
+                host = getattr(pool, "host", None) or str(pool_key)
+                st = out.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+                st["pool"] = "dedicated" if name != "*" else "default"
+                st["connections_opened"] = st.get("connections_opened", 0) + getattr(pool, "num_connections", 0)
+                idle = sum(1 for conn in list(getattr(getattr(pool, "pool", None), "queue", ()) or ()) if conn is not None)
+                st["idle_connections"] = st.get("idle_connections", 0) + idle
+        if self.limiter is not None:
+            for host, st in out.items():
+                rate, burst, concurrency = self.limiter.limits(host)
+                st["limits"] = {"rate_per_min": rate, "burst": burst, "concurrency": concurrency}
+                st["active"] = self.limiter.active(host)
+        return out
+
+
+def _build_http_client() -> _HttpClient:
+    host_pools = {}
+    for host, size in _parse_host_map(_HTTP_POOL_HOSTS).items():
+        try:
+            host_pools[host] = max(1, int(size))
+        except ValueError:
+            continue
+    defaults = _parse_host_limits(_HOST_LIMITS_DEFAULT)
+    overrides = {**defaults, **_parse_host_limits(_HOST_LIMITS, defaults)}
+    limiter = _HostLimiter(_HOST_RATE_PER_MIN, _HOST_BURST, _HOST_CONCURRENCY, overrides)
+    return _HttpClient(_HTTP_USER_AGENT, _HTTP_POOL_CONNECTIONS, _HTTP_POOL_MAXSIZE, host_pools, _HTTP_RETRIES, _HTTP_BACKOFF, _HTTP_BACKOFF_MAX, limiter, _HOST_MAX_WAIT)
+
+
+_http = _build_http_client()
+
+_SEARCH_DEADLINE = float(os.getenv("WEBTOOL_SEARCH_DEADLINE", "12"))  # overall budget for engine="multi" (seconds)
+_SEARCH_WORKERS = int(os.getenv("WEBTOOL_SEARCH_WORKERS", "4"))
+_NEWS_DEADLINE = float(os.getenv("WEBTOOL_NEWS_DEADLINE", "15"))  # overall budget for ai_company_news feeds (seconds)
+_NEWS_WORKERS = int(os.getenv("WEBTOOL_NEWS_WORKERS", "6"))
+
+
+_progress_local = threading.local()  # .sink: transport callback for notifications, .token: progressToken of the running call
+
+
+def _report_progress(progress: float, total: float | None = None, message: str | None = None):
+    """Send notifications/progress for the tool call running on this thread.
+
+    No-op unless the transport can push notifications (sink) and the request asked
+    for them (params._meta.progressToken).
+    """
+    sink = getattr(_progress_local, "sink", None)
+    token = getattr(_progress_local, "token", None)
+    if sink is None or token is None:
+        return
+    note = {"progressToken": token, "progress": progress}
+    if total is not None:
+        note["total"] = total
+    if message:
+        note["message"] = message
+    try:
+        sink({"jsonrpc": "2.0", "method": "notifications/progress", "params": note})
+    except Exception:
+        app.logger.exception("progress notification failed")
+
+
+@contextmanager
+def _progress_scope(**values):
+    """Temporarily set sink= / token= for _report_progress on this thread."""
+    previous = {name: getattr(_progress_local, name, None) for name in values}
+    for name, value in values.items():
+        setattr(_progress_local, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(_progress_local, name, value)
+
+
+def _progress_token(message) -> object | None:
+    params = message.get("params") if isinstance(message, dict) else None
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    return meta.get("progressToken") if isinstance(meta, dict) else None
+
+
+def _fan_out(tasks: dict[str, Callable[[], object]], deadline: float, max_workers: int) -> tuple[dict[str, object], list[str]]:
+    """Run named callables concurrently under one overall deadline.
+
+    Returns (results, timed_out): results maps each task that finished in time to
+    its return value (or the exception it raised), in completion order; timed_out
+    lists the rest in input order. Laggards are not waited for; their threads
+    finish in the background. Tasks wait for throttled hosts until the deadline
+    rather than failing after WEBTOOL_HOST_MAX_WAIT.
+    """
+    if not tasks:
+        return {}, []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(len(tasks), max_workers)), thread_name_prefix="webtool-fanout")
+    trace = getattr(_trace_local, "trace", None)
+    until = time.monotonic() + deadline
+
+    def run(fn):
+        _throttle_local.deadline = until
+        try:
+            return _run_traced(trace, fn)
+        finally:
+            _throttle_local.deadline = None
+
+    futures = {executor.submit(run, fn): name for name, fn in tasks.items()}
+    results: dict[str, object] = {}
+    try:
+        for fut in as_completed(futures, timeout=deadline):
+            exc = fut.exception()
+            results[futures[fut]] = exc if exc is not None else fut.result()
+            _report_progress(len(results), len(tasks), f"{futures[fut]} done")
+    except FuturesTimeout:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    timed_out = [name for name in tasks if name not in results]
+    return results, timed_out
+
 # ------------------------------------------------------------------
 # Helper functions
 # ------------------------------------------------------------------
 
-def fetch_url(url: str) -> dict:
-    """Return raw HTML of the requested URL."""
+_CACHE_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Expires", "Date", "Age")
+_FETCH_MAX_BYTES = int(os.getenv("WEBTOOL_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))  # decoded body bytes kept per page
+_FETCH_ALLOWED_TYPES = {t.strip().lower() for t in os.getenv("WEBTOOL_FETCH_ALLOWED_TYPES", "text/html,application/xhtml+xml,text/plain,text/xml,application/xml").split(",") if t.strip()}
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+
+def _read_capped(resp: requests.Response, max_bytes: int) -> tuple[bytes, bool]:
+    """Read a streamed body up to max_bytes; returns (body, truncated)."""
+    buf = bytearray()
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        if max_bytes > 0 and len(buf) + len(chunk) > max_bytes:
+            buf += chunk[: max_bytes - len(buf)]
+            return bytes(buf), True
+        buf += chunk
+    return bytes(buf), False
+
+
+def _decode_body(body: bytes, headers) -> str:
+    """Decode with the header charset, else a <meta charset>, else requests' default for the type.
+
+    headers is any case-insensitive mapping (requests or aiohttp response headers).
+    """
+    header_encoding = requests.utils.get_encoding_from_headers(headers)
+    encoding = header_encoding if "charset" in headers.get("Content-Type", "").lower() else None
+    if not encoding:
+        m = _META_CHARSET_RE.search(body[:4096])
+        encoding = m.group(1).decode("ascii", "ignore") if m else (header_encoding or "utf-8")
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        return {"content": resp.text}
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _unsolicited_304(url: str) -> str:
+    return f"Could not fetch {url}: 304 Not Modified for an unconditional request (no cached copy to reuse)"
+
+
+def fetch_url(url: str, validators: dict | None = None) -> dict:
+    """Return raw HTML of the requested URL plus its caching headers.
+
+    The body is streamed and capped at WEBTOOL_FETCH_MAX_BYTES (truncated=True when
+    cut); content types outside WEBTOOL_FETCH_ALLOWED_TYPES are rejected before the
+    body is downloaded. validators ({"etag", "last_modified"} from an earlier
+    response) make the request conditional; an unchanged page comes back as
+    {"not_modified": True}.
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        with closing(_http.get(url, timeout=10, headers=headers or None, stream=True)) as resp:
+            cache_headers = {h.lower(): resp.headers[h] for h in _CACHE_HEADERS if h in resp.headers}
+            if resp.status_code == 304:
+                if headers:
+                    return {"not_modified": True, "headers": cache_headers}
+                return {"error": _unsolicited_304(url)}
+            resp.raise_for_status()
+            content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and _FETCH_ALLOWED_TYPES and content_type not in _FETCH_ALLOWED_TYPES:
+                return {"error": f"Unsupported content type '{content_type}' at {url}: fetch_url reads HTML/text pages only."}
+            with _span("download"):
+                body, truncated = _read_capped(resp, _FETCH_MAX_BYTES)
+            _metrics.inc("webtool_upstream_bytes_total", len(body), host=_metrics.host_label((urlparse(url).hostname or "").lower()))
+            return {
+                "content": _decode_body(body, resp.headers),
+                "headers": cache_headers,
+                "content_type": content_type,
+                "bytes": len(body),
+                "truncated": truncated,
+            }
     except requests.RequestException as exc:
         return {"error": f"Could not fetch {url}: {exc}"}
 
@@ -69,7 +951,7 @@ def search_wikipedia(query: str) -> dict:
         f"https://en.wikipedia.org/api/rest_v1/page/summary/{query.replace(' ', '_')}"
     )
     try:
-        resp = requests.get(api_url, timeout=5)
+        resp = _http.get(api_url, timeout=5)
         resp.raise_for_status()
         data = resp.json()
         return {
@@ -83,6 +965,18 @@ def search_wikipedia(query: str) -> dict:
 
 
 def search_duckduckgo(query: str, max_results: int = 5) -> dict:
+    """DuckDuckGo search served through the shared search-result cache (adds cache_status)."""
+    if not query:
+        return {"error": "Empty query"}
+    payload, status = _cached_search("duckduckgo", query, max_results, partial(_search_duckduckgo_uncached, query, max_results), _ddg_payload_empty)
+    return {**payload, "cache_status": status}
+
+
+def _ddg_payload_empty(payload: dict) -> bool:
+    return bool(payload.get("error")) or not (payload.get("results") or payload.get("abstract") or payload.get("related"))
+
+
+def _search_duckduckgo_uncached(query: str, max_results: int = 5) -> dict:
     """Improved DuckDuckGo search.
     1) Try duckduckgo_search library for organic results.
     2) Fallback to lightweight HTML scrape.
@@ -94,7 +988,7 @@ def search_duckduckgo(query: str, max_results: int = 5) -> dict:
     # Attempt library (organic results)
     try:
         from duckduckgo_search import DDGS  # type: ignore
-        with DDGS() as ddgs:  # context manager handles cookies
+        with _http.throttle("duckduckgo.com"), DDGS() as ddgs:  # context manager handles cookies
             for r in ddgs.text(query, max_results=max_results):
                 if not isinstance(r, dict):
                     continue
@@ -118,9 +1012,9 @@ def search_duckduckgo(query: str, max_results: int = 5) -> dict:
     # If library failed or empty, attempt lightweight HTML scraping (best-effort; may break)
     if not results:
         try:
-            r = requests.get("https://duckduckgo.com/html/", params={"q": query}, timeout=10, headers={"User-Agent": "Mozilla/5.0 webtool-mcp"})
+            r = _http.get("https://duckduckgo.com/html/", params={"q": query}, timeout=10)
             r.raise_for_status()
-            s = BeautifulSoup(r.text, 'html.parser')
+            s = _make_soup(r.text)
             for a in s.select('a.result__a'):
                 title = _collapse(a.get_text(' '))[:240]
                 href = a.get('href')
@@ -142,7 +1036,7 @@ def search_duckduckgo(query: str, max_results: int = 5) -> dict:
     url = "https://api.duckduckgo.com/"
     params = {"q": query, "format": "json", "no_html": 1, "skip_disambig": 1, "t": "webtool-mcp"}
     try:
-        resp = requests.get(url, params=params, timeout=7)
+        resp = _http.get(url, params=params, timeout=7)
         resp.raise_for_status()
         data = resp.json()
         abstract = data.get("Abstract") or data.get("AbstractText")
@@ -178,9 +1072,9 @@ def web_search(query: str, engine: str = "duckduckgo", max_results: int = 5, eng
     def _bing(q: str) -> list[dict]:
         search_url = "https://www.bing.com/search"
         try:
-            r = requests.get(search_url, params={"q": q}, timeout=10, headers={"User-Agent": "Mozilla/5.0 webtool-mcp"})
+            r = _http.get(search_url, params={"q": q}, timeout=10)
             r.raise_for_status()
-            s = BeautifulSoup(r.text, "html.parser")
+            s = _make_soup(r.text)
             out = []
             for li in s.select("li.b_algo"):
                 a = li.select_one("h2 a")
@@ -204,7 +1098,7 @@ def web_search(query: str, engine: str = "duckduckgo", max_results: int = 5, eng
         if not key or not cx:
             return [{"error": "Missing GOOGLE_API_KEY or GOOGLE_CSE_ID env vars"}]
         try:
-            resp = requests.get("https://www.googleapis.com/customsearch/v1", params={"key": key, "cx": cx, "q": q, "num": min(max_results, 10)}, timeout=10)
+            resp = _http.get("https://www.googleapis.com/customsearch/v1", params={"key": key, "cx": cx, "q": q, "num": min(max_results, 10)}, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             items = data.get("items") or []
@@ -219,10 +1113,11 @@ def web_search(query: str, engine: str = "duckduckgo", max_results: int = 5, eng
         except Exception as e:
             return [{"error": f"google_cse_failed: {e}"}]
 
-    def _duck(q: str) -> list[dict]:
+    def _duck(q: str) -> tuple[list[dict], str]:
         r = search_duckduckgo(q, max_results=max_results)
+        status = r.get("cache_status", "miss")
         if r.get("results"):
-            return r["results"]  # type: ignore
+            return r["results"], status  # type: ignore
         # Fallback transform of instant answer "related"
         rel = r.get("related") or []
         out = []
@@ -231,31 +1126,52 @@ def web_search(query: str, engine: str = "duckduckgo", max_results: int = 5, eng
             url2 = it.get("url")
             if title and url2:
                 out.append({"title": title, "url": url2, "snippet": r.get("abstract") or ""})
+        return out, status
+
+    def _run(eng: str, q: str) -> tuple[list[dict], str]:
+        """Run one engine through the search-result cache; returns (results, 'hit'|'miss')."""
+        start = time.perf_counter()
+        if eng == "duckduckgo":
+            out = _duck(q)  # search_duckduckgo caches its own payload
+        else:
+            fn = _bing if eng == "bing" else _google_cse
+            out = _cached_search(eng, q, max_results, partial(fn, q), _search_results_empty)
+        _metrics.observe("webtool_search_duration_seconds", time.perf_counter() - start, engine=eng, cache=out[1])
+        _add_span("search", start, time.perf_counter() - start, engine=eng, cache=out[1])
         return out
 
     if engine == "multi":
         selected = engines or ["duckduckgo", "bing"]
+        runners = {"duckduckgo", "bing", "google_cse"}
+        # Engines run in parallel; the slowest no longer adds to the others' latency.
+        done, timed_out = _fan_out({eng: partial(_run, eng, query) for eng in selected if eng in runners}, _SEARCH_DEADLINE, _SEARCH_WORKERS)
         aggregate = {}
+        cache_status = {}
         for eng in selected:
-            if eng == "duckduckgo":
-                aggregate[eng] = _duck(query)
-            elif eng == "bing":
-                aggregate[eng] = _bing(query)
-            elif eng == "google_cse":
-                aggregate[eng] = _google_cse(query)
-            else:
+            if eng not in runners:
                 aggregate[eng] = [{"error": "unsupported_engine"}]
-        return {"query": query, "engine": "multi", "results": aggregate, "source": "web_search"}
-
-    if engine == "duckduckgo":
-        return {"query": query, "engine": engine, "results": _duck(query), "source": "web_search"}
-    if engine == "bing":
-        return {"query": query, "engine": engine, "results": _bing(query), "source": "web_search"}
-    if engine == "google_cse":
-        return {"query": query, "engine": engine, "results": _google_cse(query), "source": "web_search"}
+            elif eng in timed_out:
+                aggregate[eng] = [{"error": f"timeout: no answer within {_SEARCH_DEADLINE:g}s"}]
+            elif isinstance(done[eng], Exception):
+                aggregate[eng] = [{"error": f"{eng}_failed: {done[eng]}"}]
+            else:
+                aggregate[eng], cache_status[eng] = done[eng]  # type: ignore[misc]
+        payload = {"query": query, "engine": "multi", "results": aggregate, "source": "web_search", "cache_status": cache_status}
+        if timed_out:
+            payload["timed_out"] = timed_out
+        return payload
+
+    if engine in ("duckduckgo", "bing", "google_cse"):
+        results, status = _run(engine, query)
+        return {"query": query, "engine": engine, "results": results, "source": "web_search", "cache_status": status}
     return {"error": f"Unsupported engine '{engine}'", "supported": ["duckduckgo", "bing", "google_cse", "multi"]}
 
 
+def _search_results_empty(results: list[dict]) -> bool:
+    """True for results worth only a short negative-cache TTL (nothing found or only errors)."""
+    return not results or all(isinstance(r, dict) and "error" in r for r in results)
+
+
 def quick_search(query: str) -> dict:
     """Fast lightweight search (duckduckgo first, fallback to bing) limited to 3 results.
     Intended for initial scoping before deeper multi-engine exploration.
@@ -265,16 +1181,36 @@ def quick_search(query: str) -> dict:
     r = web_search(query, engine="duckduckgo", max_results=3)
     results = r.get("results") or []
     if isinstance(results, list) and results:
-        return {"query": query, "engine": "duckduckgo", "results": results, "source": "quick_search"}
+        return {"query": query, "engine": "duckduckgo", "results": results, "source": "quick_search", "cache_status": r.get("cache_status")}
     # fallback single bing
     r2 = web_search(query, engine="bing", max_results=3)
-    return {"query": query, "engine": "bing", "results": r2.get("results"), "source": "quick_search"}
+    return {"query": query, "engine": "bing", "results": r2.get("results"), "source": "quick_search", "cache_status": r2.get("cache_status")}
+
+
+def _fetch_news_feed(rss_url: str, limit: int) -> list[dict]:
+    """Fetch a Google News RSS feed and return up to limit {title,url,published} items."""
+    resp = _http.get(rss_url, timeout=10)
+    resp.raise_for_status()
+    root = ET.fromstring(resp.content)
+    items = []
+    for item in root.findall('.//item'):
+        title = (item.findtext('title') or '').strip()
+        link = (item.findtext('link') or '').strip()
+        pub_date = (item.findtext('pubDate') or '').strip()
+        if title and link:
+            items.append({"title": title, "url": link, "published": pub_date})
+        if len(items) >= limit:
+            break
+    return items
 
 
 def ai_company_news(companies: list[str] | str | None = None, limit: int = 5, locale: str = "en-US", region: str = "US") -> dict:
     """Aggregate recent news headlines per AI/tech company using Google News RSS.
 
     Default companies: OpenAI, Google, Anthropic, Microsoft, Nvidia.
+    Feeds are fetched concurrently (WEBTOOL_NEWS_WORKERS) within an overall
+    budget (WEBTOOL_NEWS_DEADLINE); companies appear in the order their feed
+    finished and slow or failed feeds are reported under "errors".
     Returns: { company: [ {title,url,published} ] }
     """
     if companies is None or (isinstance(companies, str) and not companies.strip()):
@@ -283,27 +1219,21 @@ def ai_company_news(companies: list[str] | str | None = None, limit: int = 5, lo
         companies_list = [c.strip() for c in re.split(r"[\s,]+", companies) if c.strip()]
     else:
         companies_list = [c for c in companies if c]
-    out: dict[str, list[dict]] = {}
-    errors: dict[str, str] = {}
+    tasks = {}
     for company in companies_list:
         q = quote_plus(company)
         rss_url = f"https://news.google.com/rss/search?q={q}&hl={locale}&gl={region}&ceid={region}:{locale.split('-')[0]}"
-        try:
-            resp = requests.get(rss_url, timeout=10)
-            resp.raise_for_status()
-            root = ET.fromstring(resp.content)
-            items = []
-            for item in root.findall('.//item'):
-                title = (item.findtext('title') or '').strip()
-                link = (item.findtext('link') or '').strip()
-                pub_date = (item.findtext('pubDate') or '').strip()
-                if title and link:
-                    items.append({"title": title, "url": link, "published": pub_date})
-                if len(items) >= limit:
-                    break
-            out[company] = items
-        except Exception as e:
-            errors[company] = str(e)
+        tasks[company] = partial(_fetch_news_feed, rss_url, limit)
+    done, timed_out = _fan_out(tasks, _NEWS_DEADLINE, _NEWS_WORKERS)
+    out: dict[str, list[dict]] = {}
+    errors: dict[str, str] = {}
+    for company, items in done.items():
+        if isinstance(items, Exception):
+            errors[company] = str(items)
+        else:
+            out[company] = items  # type: ignore[assignment]
+    for company in timed_out:
+        errors[company] = f"timeout: feed not fetched within {_NEWS_DEADLINE:g}s"
     result: dict[str, object] = {"companies": out, "source": "Google News RSS", "limit": limit}
     if errors:
         result["errors"] = errors
@@ -321,18 +1251,7 @@ def latvian_news(query: str | None = None, limit: int = 10) -> dict:
     else:
         rss_url = "https://news.google.com/rss?hl=lv&gl=LV&ceid=LV:lv"
     try:
-        resp = requests.get(rss_url, timeout=10)
-        resp.raise_for_status()
-        root = ET.fromstring(resp.content)
-        items = []
-        for item in root.findall('.//item'):
-            title = (item.findtext('title') or '').strip()
-            link = (item.findtext('link') or '').strip()
-            pub_date = (item.findtext('pubDate') or '').strip()
-            if title and link:
-                items.append({"title": title, "url": link, "published": pub_date})
-            if len(items) >= limit:
-                break
+        items = _fetch_news_feed(rss_url, limit)
         return {"items": items, "query": query, "source": "Google News RSS"}
     except requests.RequestException as exc:
         return {"error": f"News fetch failed: {exc}"}
@@ -343,11 +1262,12 @@ def available_functions_info() -> dict:
     info = {
         "status": "ok",
         "functions": {
-            "fetch_url": {"args": {"url": "string", "chunk_id": "string?", "mode": "string? (outline)", "link_id": "string? (e.g. L7)"}},
+            "fetch_url": {"args": {"url": "string", "chunk_id": "string?", "mode": "string? (outline|links|toc)", "link_id": "string? (e.g. L7)", "prefetch": "int? (outline: warm first N links)", "timings": "bool? (add a timings: line to META)", "max_tokens": "int? (output budget; merges/splits sections and trims to fit)", "offset": "int? (chars into chunk_id / items into links|toc)", "cursor": "string? (next_cursor from a previous call)", "query": "string? (return the best-matching sections inline)", "top_k": "int? (sections for query, default 3)"}},
             "search_wikipedia": {"args": {"query": "string"}},
             "latvian_news": {"args": {"query": "string?"}},
             "search_duckduckgo": {"args": {"query": "string"}},
             "ai_company_news": {"args": {"companies": "string|list?", "limit": "int?"}},
+            "search_cache": {"args": {"query": "string", "max_results": "int?", "site": "string?"}},
             "get_system_prompt": {"args": {}},
         },
         "usage": [
@@ -355,6 +1275,7 @@ def available_functions_info() -> dict:
             {"name": "fetch_url", "arguments": {"url": "https://example.com", "chunk_id": "sec-2"}},
             {"name": "fetch_url", "arguments": {"url": "https://example.com", "mode": "outline"}},
             {"name": "fetch_url", "arguments": {"url": "https://example.com", "link_id": "L3"}},
+            {"name": "fetch_url", "arguments": {"url": "https://example.com", "query": "pricing limits", "top_k": 2}},
             {"name": "search_wikipedia", "arguments": {"query": "Python"}},
             {"name": "latvian_news", "arguments": {}},
             {"name": "latvian_news", "arguments": {"query": "tehnoloģijas"}},
@@ -379,147 +1300,1134 @@ def _jsonrpc_error(_id, code, message, data=None):
     return {"jsonrpc": "2.0", "id": _id, "error": err}
 
 
-def _sse_stream():
-    yield "event: ready\ndata: {}\n\n"
-    while True:
-        yield ": keep-alive\n\n"
-        time.sleep(15)
-
 # ------------------------------------------------------------------
-# Caching & Rate Limiting (new)
+# Server-sent events: session hub with one shared keep-alive timer
 # ------------------------------------------------------------------
 
-_HTML_CACHE_TTL = int(os.getenv("WEBTOOL_CACHE_TTL", "300"))  # seconds
-_HTML_CACHE_MAX = int(os.getenv("WEBTOOL_HTML_CACHE_SIZE", "64"))
-_OUTLINE_CACHE_TTL = int(os.getenv("WEBTOOL_OUTLINE_CACHE_TTL", "300"))
-_FETCH_RATE_PER_MIN = int(os.getenv("WEBTOOL_FETCH_URL_RATE_PER_MIN", "60"))
+_SSE_KEEPALIVE = float(os.getenv("WEBTOOL_SSE_KEEPALIVE", "15"))  # seconds between keep-alive comments
+_SSE_MAX_SESSIONS = int(os.getenv("WEBTOOL_SSE_MAX_SESSIONS", "10000"))
+_SSE_QUEUE_MAX = int(os.getenv("WEBTOOL_SSE_QUEUE_MAX", "256"))  # undelivered frames kept per session
+_SSE_WORKERS = int(os.getenv("WEBTOOL_SSE_WORKERS", "16"))  # threads running tool calls POSTed to a session
 
-_html_cache_lock = threading.Lock()
-_outline_cache_lock = threading.Lock()
 
-class _LRUCache:
-    def __init__(self, capacity: int):
-        self.capacity = capacity
-        self.data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+class _SseSession:
+    """Outbound frame queue of one GET /mcp subscriber.
 
-    def get(self, key: str, ttl: int) -> str | None:
-        now = time.time()
-        with _html_cache_lock:
-            item = self.data.get(key)
-            if not item:
-                return None
-            ts, val = item
-            if now - ts > ttl:
-                del self.data[key]
-                return None
-            # move to end
-            self.data.move_to_end(key)
-            return val
+    Producers (tool calls, the keep-alive timer) push from any thread; the stream
+    either blocks in wait() (threaded server) or is woken through `waker` (asyncio).
+    """
 
-    def put(self, key: str, value: str):
-        with _html_cache_lock:
-            if key in self.data:
-                self.data.move_to_end(key)
-            self.data[key] = (time.time(), value)
-            while len(self.data) > self.capacity:
-                self.data.popitem(last=False)
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.frames: deque[str] = deque(maxlen=max(1, _SSE_QUEUE_MAX))
+        self.cond = threading.Condition()
+        self.waker: Callable[[], None] | None = None
+        self.closed = False
+        self.dropped = 0
 
-_html_cache = _LRUCache(_HTML_CACHE_MAX)
-_outline_cache = _LRUCache(_HTML_CACHE_MAX)
+    def push(self, frame: str):
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.cond.notify()
+        waker = self.waker
+        if waker is not None:
+            try:
+                waker()
+            except RuntimeError:  # event loop already closed
+                pass
 
-_rate_lock = threading.Lock()
-_fetch_timestamps = deque()  # timestamps of fetch_url network fetches
+    def send(self, event: str, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        self.push(f"event: {event}\ndata: {data}\n\n")
 
-def _rate_limited_fetch_allowed() -> bool:
-    """Return True if another network fetch_url is allowed under rate limit."""
-    if _FETCH_RATE_PER_MIN <= 0:
-        return True
-    now = time.time()
-    window_start = now - 60
-    with _rate_lock:
-        # drop old
-        while _fetch_timestamps and _fetch_timestamps[0] < window_start:
-            _fetch_timestamps.popleft()
-        if len(_fetch_timestamps) >= _FETCH_RATE_PER_MIN:
-            return False
-        _fetch_timestamps.append(now)
-        return True
+    def drain(self) -> list[str]:
+        with self.cond:
+            frames = list(self.frames)
+            self.frames.clear()
+        return frames
 
-def _cached_fetch_html(url: str) -> tuple[str | None, bool, str | None]:
-    """Return (html, cache_hit, error)."""
-    key = url.strip()
-    html = _html_cache.get(key, _HTML_CACHE_TTL)
-    if html is not None:
-        return html, True, None
-    # rate limiting only for real network fetches
-    if not _rate_limited_fetch_allowed():
-        return None, False, f"Rate limit exceeded: max {_FETCH_RATE_PER_MIN} fetch_url network requests per minute. Try later or rely on cached outline/chunks."
-    res = fetch_url(url)
-    if isinstance(res, dict) and res.get("error"):
-        return None, False, res["error"]
-    html = res.get("content", "")
-    if html:
-        _html_cache.put(key, html)
-    return html, False, None
+    def wait(self) -> list[str]:
+        with self.cond:
+            while not self.frames and not self.closed:
+                self.cond.wait()
+        return self.drain()
 
-def _outline_cache_key(url: str) -> str:
-    return f"outline::{url.strip()}"
 
-def _get_cached_outline(url: str) -> str | None:
-    return _outline_cache.get(_outline_cache_key(url), _OUTLINE_CACHE_TTL)
+class _SseHub:
+    """Registry of open SSE sessions.
 
-def _store_cached_outline(url: str, text: str):
-    _outline_cache.put(_outline_cache_key(url), text)
-    app.logger.debug(f"Stored outline cache for {url}")
+    An idle subscriber costs a queue and a parked stream (a coroutine in async mode);
+    one daemon thread sends keep-alives to all of them every WEBTOOL_SSE_KEEPALIVE
+    seconds instead of one sleeping loop per client.
+    """
 
-# ------------------------------------------------------------------
-# Structured page extraction (replaces earlier simple fallback)
-# ------------------------------------------------------------------
+    def __init__(self, keepalive: float, max_sessions: int):
+        self.keepalive = max(1.0, keepalive)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: dict[str, _SseSession] = {}
+        self._timer: threading.Thread | None = None
+        self.opened = 0
+        self.messages = 0
 
-_TOKEN_EST_CHARS_PER = 4  # heuristic
+    def open(self) -> _SseSession | None:
+        """Register a subscriber (None when WEBTOOL_SSE_MAX_SESSIONS is reached)."""
+        session = _SseSession(uuid.uuid4().hex)
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            self._sessions[session.id] = session
+            self.opened += 1
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._keepalive_loop, name="webtool-sse-keepalive", daemon=True)
+                self._timer.start()
+        session.push("event: ready\ndata: {}\n\n")
+        session.send("endpoint", f"/mcp?session_id={session.id}")
+        return session
 
-_HEADING_TAGS = ["h1", "h2", "h3"]
+    def get(self, session_id: str | None) -> _SseSession | None:
+        with self._lock:
+            return self._sessions.get(session_id or "")
 
-_WS_RE = re.compile(r"\s+")
-_CAP_ENTITY_RE = re.compile(r"\b(?:[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b")
-_DATE_RE = re.compile(r"\b(20\d{2}|19\d{2})\b")
-_NUMBER_RE = re.compile(r"\b\d{2,}\b")
+    def close(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            with session.cond:
+                session.closed = True
+                session.cond.notify_all()
 
+    def deliver(self, session: _SseSession, data, prefetched: dict | None = None):
+        """Run a payload POSTed for `session`; push progress notifications and the response to its stream."""
+        with _trace_request("sse"):
+            try:
+                with _progress_scope(sink=partial(session.send, "message")):
+                    body = _handle_mcp_payload(data, prefetched)
+            except Exception as exc:
+                app.logger.exception("SSE tool call failed")
+                body = _jsonrpc_error(data.get("id") if isinstance(data, dict) else None, -32603, f"Internal error: {exc}")
+            if body is None or (_is_jsonrpc(data) and "id" not in data):
+                return  # notifications get no response
+            with self._lock:
+                self.messages += 1
+            with _span("serialize"):
+                session.send("message", body)
 
-def _now_iso():
-    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    def _keepalive_loop(self):
+        while True:
+            time.sleep(self.keepalive)
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                session.push(": keep-alive\n\n")
 
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "opened": self.opened,
+                "messages": self.messages,
+                "dropped_frames": sum(s.dropped for s in self._sessions.values()),
+            }
 
-def _collapse(text: str) -> str:
-    return _WS_RE.sub(" ", text).strip()
 
+_sse_hub = _SseHub(_SSE_KEEPALIVE, _SSE_MAX_SESSIONS)
+_sse_executor = ThreadPoolExecutor(max_workers=max(1, _SSE_WORKERS), thread_name_prefix="webtool-sse")
 
-def _token_estimate(text: str) -> int:
-    return max(1, len(text) // _TOKEN_EST_CHARS_PER)
 
+def _sse_stream(session: _SseSession):
+    """Blocking generator for the threaded server: wakes only when a frame is queued."""
+    try:
+        while not session.closed:
+            for frame in session.wait():
+                yield frame
+    finally:
+        _sse_hub.close(session.id)
 
-def _select_main(soup: BeautifulSoup) -> Tag:  # revised to guarantee Tag return
-    for sel in ["main", "article"]:
-        tag = soup.find(sel)
-        if isinstance(tag, Tag):
-            return tag
-    body = soup.body
-    if isinstance(body, Tag):
-        return body
-    # BeautifulSoup itself subclasses Tag enough for our usage; cast for type checker
-    return cast(Tag, soup)
+# ------------------------------------------------------------------
+# Caching & Rate Limiting (new)
+# ------------------------------------------------------------------
 
+_HTML_CACHE_TTL = int(os.getenv("WEBTOOL_CACHE_TTL", "300"))  # seconds
+_HTML_CACHE_MAX = int(os.getenv("WEBTOOL_HTML_CACHE_SIZE", "0"))  # optional entry cap (0 = bounded by bytes only)
+_HTML_CACHE_BYTES = int(os.getenv("WEBTOOL_HTML_CACHE_BYTES", str(64 * 1024 * 1024)))
+_OUTLINE_CACHE_TTL = int(os.getenv("WEBTOOL_OUTLINE_CACHE_TTL", "300"))
+_OUTLINE_CACHE_BYTES = int(os.getenv("WEBTOOL_OUTLINE_CACHE_BYTES", str(8 * 1024 * 1024)))
+_PAGE_CACHE_TTL = int(os.getenv("WEBTOOL_PAGE_CACHE_TTL", "3600"))  # parsed pages are keyed by content hash
+_PAGE_CACHE_MAX = int(os.getenv("WEBTOOL_PAGE_CACHE_SIZE", "0"))
+_PAGE_CACHE_BYTES = int(os.getenv("WEBTOOL_PAGE_CACHE_BYTES", str(64 * 1024 * 1024)))
+_HTML_CACHE_MIN_FRESHNESS = int(os.getenv("WEBTOOL_CACHE_MIN_FRESHNESS", "60"))  # floor when the origin sends no freshness information
+_HTML_CACHE_MAX_FRESHNESS = int(os.getenv("WEBTOOL_CACHE_MAX_FRESHNESS", "86400"))
+# Expired HTML / outline entries younger than lifetime + window are served at once and refreshed in the background.
+_CACHE_STALE_WINDOW = int(os.getenv("WEBTOOL_CACHE_STALE_WINDOW", "0"))  # seconds; upstream stale-while-revalidate=N wins
+_REFRESH_WORKERS = int(os.getenv("WEBTOOL_REFRESH_WORKERS", "2"))
+_SEARCH_CACHE_TTL = int(os.getenv("WEBTOOL_SEARCH_CACHE_TTL", "600"))
+_SEARCH_NEGATIVE_TTL = int(os.getenv("WEBTOOL_SEARCH_NEGATIVE_TTL", "60"))  # empty / failed search results
+_SEARCH_CACHE_BYTES = int(os.getenv("WEBTOOL_SEARCH_CACHE_BYTES", str(8 * 1024 * 1024)))
+_CACHE_COMPRESS_LEVEL = int(os.getenv("WEBTOOL_CACHE_COMPRESS_LEVEL", "1"))  # zlib level, 0 = store uncompressed
+# Persistent second tier (SQLite) shared by restarts and worker processes; off unless a directory is given.
+_DISK_CACHE_DIR = os.getenv("WEBTOOL_DISK_CACHE_DIR", "")
+_DISK_CACHE_BYTES = int(os.getenv("WEBTOOL_DISK_CACHE_BYTES", str(512 * 1024 * 1024)))
+_DISK_CACHE_MAX_AGE = int(os.getenv("WEBTOOL_DISK_CACHE_MAX_AGE", "86400"))  # rows older than this are compacted away
+_DISK_CACHE_COMPACT_INTERVAL = int(os.getenv("WEBTOOL_DISK_CACHE_COMPACT_INTERVAL", "300"))
+# Local full-text index of every parsed page (search_cache tool); kept in memory unless a directory is given.
+_INDEX_DIR = os.getenv("WEBTOOL_INDEX_DIR", _DISK_CACHE_DIR)
+_INDEX_BYTES = int(os.getenv("WEBTOOL_INDEX_BYTES", str(128 * 1024 * 1024)))  # indexed text budget; oldest pages are dropped past it, 0 disables the index
+_INDEX_MAX_RESULTS = 50
 
-def _extract_nav_links(soup: BeautifulSoup, base_url: str) -> list[dict]:
+
+def _approx_size(obj) -> int:
+    """Rough in-memory footprint of a value made of str / bytes / dict / list (used for byte budgets)."""
+    if isinstance(obj, str):
+        return 49 + len(obj)
+    if isinstance(obj, bytes):
+        return 33 + len(obj)
+    if isinstance(obj, dict):
+        return 64 + sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return 56 + sum(8 + _approx_size(v) for v in obj)
+    return 32
+
+
+def _encode_cache_value(value, level: int) -> bytes:
+    if isinstance(value, str):
+        return b"s" + zlib.compress(value.encode("utf-8", "surrogatepass"), level)
+    return b"p" + zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+
+def _decode_cache_value(blob: bytes):
+    if blob[:1] == b"s":
+        return zlib.decompress(blob[1:]).decode("utf-8", "surrogatepass")
+    return pickle.loads(zlib.decompress(blob[1:]))
+
+
+class _DiskCache:
+    """SQLite-backed cache tier (WAL mode) safe for concurrent use by threads and processes.
+
+    Rows hold the same compressed blobs as the memory tier plus their creation
+    time, so TTLs keep working across restarts. Compaction (expired rows, size
+    cap by least-recent access, incremental vacuum) runs opportunistically every
+    compact_interval seconds from whichever process writes next. Any SQLite error
+    is logged and treated as a miss; the disk tier never fails a request.
+    Values other than str are pickled, so a file written by a different
+    FORMAT_VERSION is emptied on open instead of being decoded.
+    """
+
+    FORMAT_VERSION = 1  # bump when a cached value's shape changes (e.g. the parsed page model)
+
+    def __init__(self, path: str, max_bytes: int, max_age: int, compact_interval: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compact_interval = compact_interval
+        self._pool: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._last_compact = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.compactions = 0
+        with self._conn() as conn:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only effective on a fresh database file
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.FORMAT_VERSION:
+                conn.execute("DROP TABLE IF EXISTS entries")
+                conn.execute(f"PRAGMA user_version={self.FORMAT_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (ns, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @contextmanager
+    def _conn(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get_blob(self, ns: str, key: str) -> tuple[float, bytes] | None:
+        """Return (created_ts, blob) or None. TTL checks are left to the caller."""
+        try:
+            with self._conn() as conn:
+                row = conn.execute("SELECT created, value, accessed FROM entries WHERE ns=? AND key=?", (ns, key)).fetchone()
+                if row is None:
+                    self._count("misses")
+                    return None
+                now = time.time()
+                if now - row[2] > 60:  # coarse access time keeps reads mostly write-free
+                    conn.execute("UPDATE entries SET accessed=? WHERE ns=? AND key=?", (now, ns, key))
+        except sqlite3.Error as exc:
+            self._count("errors")
+            app.logger.warning(f"disk cache read failed: {exc}")
+            return None
+        self._count("hits")
+        return row[0], row[1]
+
+    def put_blob(self, ns: str, key: str, blob: bytes, created: float):
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (ns, key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (ns, key, sqlite3.Binary(blob), len(blob) + len(key), created, time.time()),
+                )
+        except sqlite3.Error as exc:
+            self._count("errors")
+            app.logger.warning(f"disk cache write failed: {exc}")
+            return
+        self._count("writes")
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_compact < self.compact_interval:
+                return
+            self._last_compact = now
+        self.compact()
+
+    def compact(self):
+        """Drop rows past max_age, trim to 90% of max_bytes by least-recent access, reclaim free pages."""
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.max_age,))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if self.max_bytes > 0 and total > self.max_bytes:
+                    excess = total - int(self.max_bytes * 0.9)
+                    doomed = []
+                    for ns, key, size in conn.execute("SELECT ns, key, size FROM entries ORDER BY accessed"):
+                        if excess <= 0:
+                            break
+                        doomed.append((ns, key))
+                        excess -= size
+                    conn.executemany("DELETE FROM entries WHERE ns=? AND key=?", doomed)
+                conn.execute("PRAGMA incremental_vacuum")
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error as exc:
+            self._count("errors")
+            app.logger.warning(f"disk cache compaction failed: {exc}")
+            return
+        self._count("compactions")
+
+    def stats(self) -> dict:
+        out = {"path": self.path, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+               "writes": self.writes, "errors": self.errors, "compactions": self.compactions}
+        try:
+            with self._conn() as conn:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            out.update({"entries": entries, "bytes": size})
+        except sqlite3.Error:
+            pass
+        return out
+
+
+def _open_disk_cache() -> "_DiskCache | None":
+    if not _DISK_CACHE_DIR:
+        return None
+    try:
+        os.makedirs(_DISK_CACHE_DIR, exist_ok=True)
+        return _DiskCache(os.path.join(_DISK_CACHE_DIR, "cache.sqlite3"), _DISK_CACHE_BYTES, _DISK_CACHE_MAX_AGE, _DISK_CACHE_COMPACT_INTERVAL)
+    except (OSError, sqlite3.Error) as exc:
+        app.logger.warning(f"disk cache disabled ({_DISK_CACHE_DIR}): {exc}")
+        return None
+
+
+_disk_cache = _open_disk_cache()
+
+
+class _PageIndex:
+    """Incremental BM25 full-text index (SQLite FTS5) over the sections of every parsed page.
+
+    One row per chunk (heading + text) keyed by URL; re-indexing a URL whose content
+    hash changed replaces its rows, an unchanged hash is skipped. Writes happen on a
+    single background thread so parsing never waits for them. When the indexed text
+    exceeds max_bytes the least recently indexed pages are dropped down to 90% of it.
+    Like the disk cache, SQLite errors are logged and never fail a request.
+    """
+
+    SCHEMA_VERSION = 2  # bump when the tables change; older index files are rebuilt from scratch
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._pool: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webtool-index")
+        self.indexed = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.searches = 0
+        self.errors = 0
+        if path == ":memory:":  # one connection holds the whole database; _conn hands it out in turn
+            self._pool.put(sqlite3.connect(path, isolation_level=None, check_same_thread=False))
+        with self._conn() as conn:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                for table in ("chunks", "chunk_rows", "pages"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+            conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, host TEXT NOT NULL, digest TEXT NOT NULL, title TEXT NOT NULL, size INTEGER NOT NULL, indexed REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS chunk_rows (id INTEGER PRIMARY KEY, url TEXT NOT NULL, chunk_id TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunk_rows_url ON chunk_rows (url)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_indexed ON pages (indexed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_host ON pages (host)")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(heading, text, tokenize='unicode61 remove_diacritics 2')")
+
+    @contextmanager
+    def _conn(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            if self.path == ":memory:":
+                conn = self._pool.get()
+            else:
+                conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA busy_timeout=10000")
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def add(self, url: str, digest: str, page: dict):
+        """Queue a parsed page (see _parse_page) for indexing."""
+        self._executor.submit(self._index, url.strip(), digest, page)
+
+    def _index(self, url: str, digest: str, page: dict):
+        rows = [(c["id"], c["heading"], c["text"]) for c in page["chunks"] if c.get("text") or c.get("heading")]
+        size = sum(len(heading) + len(text) for _, heading, text in rows)
+        try:
+            with self._conn() as conn:
+                known = conn.execute("SELECT digest FROM pages WHERE url=?", (url,)).fetchone()
+                if known is not None and known[0] == digest:
+                    conn.execute("UPDATE pages SET indexed=? WHERE url=?", (time.time(), url))
+                    self._count("skipped")
+                    return
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._delete(conn, [url])
+                    for chunk_id, heading, text in rows:
+                        rowid = conn.execute("INSERT INTO chunk_rows (url, chunk_id) VALUES (?, ?)", (url, chunk_id)).lastrowid
+                        conn.execute("INSERT INTO chunks (rowid, heading, text) VALUES (?, ?, ?)", (rowid, heading, text))
+                    conn.execute("INSERT INTO pages (url, host, digest, title, size, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                                 (url, (urlparse(url).hostname or "").lower(), digest, page.get("title") or "", size, time.time()))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self._count("indexed")
+                self._trim(conn)
+        except sqlite3.Error as exc:
+            self._count("errors")
+            app.logger.warning(f"page index write failed for {url}: {exc}")
+
+    @staticmethod
+    def _delete(conn, urls: list[str]):
+        for url in urls:
+            ids = [row[0] for row in conn.execute("SELECT id FROM chunk_rows WHERE url=?", (url,))]
+            conn.executemany("DELETE FROM chunks WHERE rowid=?", [(i,) for i in ids])
+            conn.execute("DELETE FROM chunk_rows WHERE url=?", (url,))
+            conn.execute("DELETE FROM pages WHERE url=?", (url,))
+
+    def _trim(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if self.max_bytes <= 0 or total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9)
+        doomed = []
+        for url, size in conn.execute("SELECT url, size FROM pages ORDER BY indexed"):
+            if excess <= 0:
+                break
+            doomed.append(url)
+            excess -= size
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete(conn, doomed)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("INSERT INTO chunks (chunks, rank) VALUES ('merge', 500)")
+        conn.execute("PRAGMA incremental_vacuum")
+        self._count("dropped", len(doomed))
+
+    def search(self, query: str, limit: int = 10, site: str | None = None) -> list[dict]:
+        """BM25-ranked chunks matching any word of query (heading matches weigh double).
+
+        site restricts hits to that hostname and its subdomains.
+        """
+        terms = re.findall(r"\w+", query.lower())[:32]
+        if not terms:
+            return []
+        sql = (
+            "SELECT m.url, m.chunk_id, p.title, chunks.heading, snippet(chunks, -1, '[', ']', ' … ', 24), bm25(chunks, 2.0, 1.0) AS score"
+            " FROM chunks JOIN chunk_rows m ON m.id = chunks.rowid JOIN pages p ON p.url = m.url WHERE chunks MATCH ?"
+        )
+        args: list = [" OR ".join(f'"{t}"' for t in terms)]
+        if site:
+            sql += " AND (p.host = ? OR substr(p.host, -length(?)) = ?)"
+            args += [site, "." + site, "." + site]
+        sql += " ORDER BY score LIMIT ?"
+        args.append(limit)
+        self._count("searches")
+        with self._conn() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        return [{"url": url, "chunk_id": chunk_id, "title": title, "heading": heading, "snippet": snippet, "score": round(-score, 3)}
+                for url, chunk_id, title, heading, snippet, score in rows]
+
+    def stats(self) -> dict:
+        out = {"path": self.path, "max_bytes": self.max_bytes, "indexed": self.indexed, "skipped": self.skipped,
+               "dropped": self.dropped, "searches": self.searches, "errors": self.errors}
+        try:
+            with self._conn() as conn:
+                pages, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+                chunks = conn.execute("SELECT COUNT(*) FROM chunk_rows").fetchone()[0]
+            out.update({"pages": pages, "chunks": chunks, "bytes": size})
+        except sqlite3.Error:
+            pass
+        return out
+
+
+def _open_page_index() -> "_PageIndex | None":
+    if _INDEX_BYTES <= 0:
+        return None
+    try:
+        if not _INDEX_DIR:
+            return _PageIndex(":memory:", _INDEX_BYTES)
+        os.makedirs(_INDEX_DIR, exist_ok=True)
+        return _PageIndex(os.path.join(_INDEX_DIR, "index.sqlite3"), _INDEX_BYTES)
+    except (OSError, sqlite3.Error) as exc:  # e.g. SQLite built without FTS5
+        app.logger.warning(f"page index disabled ({_INDEX_DIR or 'in memory'}): {exc}")
+        return None
+
+
+_page_index = _open_page_index()
+
+
+def search_cache(query: str, max_results: int = 10, site: str | None = None) -> dict:
+    """Search the local full-text index of previously fetched pages (offline, BM25-ranked)."""
+    if _page_index is None:
+        return {"error": "local page index is disabled (WEBTOOL_INDEX_BYTES is 0 or WEBTOOL_INDEX_DIR is unusable)"}
+    query = (query or "").strip()
+    if not query:
+        return {"error": "query required"}
+    try:
+        limit = max(1, min(int(max_results or 10), _INDEX_MAX_RESULTS))
+    except (TypeError, ValueError):
+        limit = 10
+    site = (site or "").strip().lower()
+    domain = (urlparse(site if "//" in site else f"//{site}").hostname or "") if site else None
+    start = time.perf_counter()
+    try:
+        results = _page_index.search(query, limit, domain)
+    except sqlite3.Error as exc:
+        _page_index._count("errors")
+        return {"error": f"index search failed: {exc}"}
+    return {"query": query, "site": domain, "results": results, "took_ms": round((time.perf_counter() - start) * 1000, 2), "source": "search_cache"}
+
+
+class _LRUCache:
+    """Thread-safe LRU bounded by total bytes (and optionally entry count), TTL checked on read.
+
+    With compression enabled values are stored zlib-compressed (str as UTF-8,
+    anything else pickled) and decoded on every hit; otherwise the live object is
+    kept and its size estimated with _approx_size. Each instance has its own lock.
+    """
+
+    def __init__(self, name: str, max_bytes: int, capacity: int = 0, compress_level: int = _CACHE_COMPRESS_LEVEL, disk: "_DiskCache | None" = None):
+        self.name = name
+        self.disk = disk  # optional persistent tier, namespaced by cache name
+        self.max_bytes = max_bytes
+        self.capacity = capacity
+        self.compress_level = compress_level
+        self.data: OrderedDict[str, tuple[float, object, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl: int):
+        entry = self.get_entry(key, ttl)
+        return entry[1] if entry else None
+
+    def get_entry(self, key: str, ttl: int | None = None) -> tuple[float, object] | None:
+        """Return (stored_at, value) or None. With ttl=None expired entries are returned
+        as-is and freshness is left to the caller (e.g. HTTP revalidation)."""
+        now = time.time()
+        with self._lock:
+            item = self.data.get(key)
+            if item:
+                ts, stored, size = item
+                if ttl is not None and now - ts > ttl:
+                    del self.data[key]
+                    self.bytes -= size
+                    self.expirations += 1
+                    self.misses += 1
+                    return None
+                # move to end
+                self.data.move_to_end(key)
+                self.hits += 1
+            elif self.disk is None:
+                self.misses += 1
+                return None
+        if not item:
+            return self._get_from_disk(key, ttl, now)
+        return ts, (_decode_cache_value(stored) if self.compress_level > 0 else stored)
+
+    def _get_from_disk(self, key: str, ttl: int | None, now: float) -> tuple[float, object] | None:
+        row = self.disk.get_blob(self.name, key) if self.disk else None
+        if row is None or (ttl is not None and now - row[0] > ttl):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            value = _decode_cache_value(row[1])
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._store(key, value, row[0], blob=row[1] if self.compress_level > 0 else None)
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        return row[0], value
+
+    def put(self, key: str, value):
+        now = time.time()
+        blob = self._store(key, value, now)
+        if self.disk is not None:
+            if blob is None:
+                blob = _encode_cache_value(value, max(1, _CACHE_COMPRESS_LEVEL))
+            self.disk.put_blob(self.name, key, blob, now)
+
+    def _store(self, key: str, value, ts: float, blob: bytes | None = None) -> bytes | None:
+        """Insert into the memory tier; returns the compressed blob when one was produced."""
+        if self.compress_level > 0:
+            stored = blob if blob is not None else _encode_cache_value(value, self.compress_level)
+            size = len(stored) + len(key)
+        else:
+            stored = value
+            size = _approx_size(value) + len(key)
+        with self._lock:
+            old = self.data.pop(key, None)
+            if old:
+                self.bytes -= old[2]
+            if self.max_bytes > 0 and size > self.max_bytes:
+                return stored if self.compress_level > 0 else None  # larger than the whole memory budget
+            self.data[key] = (ts, stored, size)
+            self.bytes += size
+            while self.data and ((self.max_bytes > 0 and self.bytes > self.max_bytes) or (self.capacity > 0 and len(self.data) > self.capacity)):
+                _, (_, _, evicted_size) = self.data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return stored if self.compress_level > 0 else None
+
+    def clear(self):
+        """Drop every in-memory entry (the disk tier, if any, is left alone)."""
+        with self._lock:
+            self.data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "compressed": self.compress_level > 0,
+                "disk_hits": self.disk_hits,
+            }
+
+_html_cache = _LRUCache("html", _HTML_CACHE_BYTES, _HTML_CACHE_MAX, disk=_disk_cache)
+_outline_cache = _LRUCache("outline", _OUTLINE_CACHE_BYTES, _HTML_CACHE_MAX)
+_page_cache = _LRUCache("page", _PAGE_CACHE_BYTES, _PAGE_CACHE_MAX, compress_level=0, disk=_disk_cache)  # url + parser backend + content hash -> parsed page model (see _page_model); kept live for fast chunk/link views
+
+
+_search_cache = _LRUCache("search", _SEARCH_CACHE_BYTES)
+
+
+def _search_cache_key(engine: str, query: str, max_results) -> str:
+    try:
+        n = int(max_results)
+    except (TypeError, ValueError):
+        n = 5
+    return f"{engine}::{n}::{_collapse(query).lower()}"
+
+
+def _cached_search(engine: str, query: str, max_results, fetch: Callable[[], object], is_empty: Callable[[object], bool]) -> tuple[object, str]:
+    """Return (value, 'hit'|'miss') for a search keyed by normalized (engine, query, max_results).
+
+    Empty or failed results are kept only for WEBTOOL_SEARCH_NEGATIVE_TTL so a
+    transient engine failure is retried soon without hammering the engine.
+    """
+    key = _search_cache_key(engine, query, max_results)
+    cached = _search_cache.get_entry(key)
+    if cached is not None:
+        stored_at, entry = cached
+        ttl = _SEARCH_NEGATIVE_TTL if entry["negative"] else _SEARCH_CACHE_TTL
+        if time.time() - stored_at <= ttl:
+            return entry["value"], "hit"
+    value = fetch()
+    _search_cache.put(key, {"value": value, "negative": bool(is_empty(value))})
+    return value, "miss"
+
+
+_revalidation_lock = threading.Lock()
+_revalidation_stats = {"not_modified": 0, "modified": 0}  # outcomes of conditional GETs for expired HTML
+
+
+class _SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller (leader) runs the work; callers arriving while it is in flight
+    wait for the same result (or exception) instead of repeating it. Waiters can be
+    threads (do) or coroutines awaiting asyncio.wrap_future(future) from begin().
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key: str) -> tuple[Future, bool]:
+        """(future, is_leader). A leader must call finish() exactly once."""
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self.leaders += 1
+            return fut, True
+
+    def finish(self, key: str, fut: Future, result=None, exc: BaseException | None = None):
+        with self._lock:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], object]) -> tuple[object, bool]:
+        """Return (fn() result, shared) where shared is True for coalesced waiters."""
+        fut, leader = self.begin(key)
+        if not leader:
+            with _span(f"coalesced_{self.name}"):
+                return fut.result(), True
+        try:
+            result = fn()
+        except BaseException as exc:
+            self.finish(key, fut, exc=exc)
+            raise
+        self.finish(key, fut, result)
+        return result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+_html_flight = _SingleFlight("html")  # download + cache store per URL
+_parse_flight = _SingleFlight("page")  # parse per URL + content hash
+
+
+def _cache_stats() -> dict:
+    out = {c.name: c.stats() for c in (_html_cache, _outline_cache, _page_cache, _search_cache)}
+    with _revalidation_lock:
+        out["html"]["revalidations"] = dict(_revalidation_stats)
+    out["html"]["single_flight"] = _html_flight.stats()
+    out["page"]["single_flight"] = _parse_flight.stats()
+    with _refresh_lock:
+        out["stale_refresh"] = {**_refresh_stats, "in_flight": len(_refresh_inflight), "window": _CACHE_STALE_WINDOW}
+    if _disk_cache is not None:
+        out["disk"] = _disk_cache.stats()
+    if _page_index is not None:
+        out["index"] = _page_index.stats()
+    return out
+
+def _parse_cache_control(value: str) -> dict[str, str]:
+    out = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            out[name.lower()] = arg.strip().strip('"')
+    return out
+
+
+def _freshness_lifetime(headers: dict, cc: dict[str, str]) -> float:
+    """Seconds a response stays fresh: s-maxage / max-age (minus Age), else Expires - Date,
+    capped at WEBTOOL_CACHE_MAX_FRESHNESS. Without any of those (or no-cache) the lifetime is
+    WEBTOOL_CACHE_TTL, raised to WEBTOOL_CACHE_MIN_FRESHNESS; an explicit 0 is kept."""
+    if not ("no-cache" in cc or cc.get("s-maxage", "").isdigit() or cc.get("max-age", "").isdigit() or headers.get("expires")):
+        return max(_HTML_CACHE_MIN_FRESHNESS, min(_HTML_CACHE_MAX_FRESHNESS, _HTML_CACHE_TTL))
+    lifetime: float = 0
+    age = int(headers["age"]) if str(headers.get("age", "")).isdigit() else 0
+    if "no-cache" in cc:
+        lifetime = 0
+    elif cc.get("s-maxage", "").isdigit():
+        lifetime = int(cc["s-maxage"]) - age
+    elif cc.get("max-age", "").isdigit():
+        lifetime = int(cc["max-age"]) - age
+    elif headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+            date = parsedate_to_datetime(headers["date"]).timestamp() if headers.get("date") else time.time()
+            lifetime = expires - date
+        except (TypeError, ValueError, IndexError, OverflowError):
+            lifetime = 0  # invalid Expires means already expired
+    return max(0, min(_HTML_CACHE_MAX_FRESHNESS, lifetime))
+
+
+def _stale_window(cc: dict[str, str]) -> int:
+    """Seconds an expired response may still be served while it is refreshed (RFC 5861)."""
+    if "must-revalidate" in cc or "proxy-revalidate" in cc or "no-cache" in cc:
+        return 0
+    if cc.get("stale-while-revalidate", "").isdigit():
+        return int(cc["stale-while-revalidate"])
+    return _CACHE_STALE_WINDOW
+
+
+def _html_cache_entry(html: str, headers: dict, truncated: bool = False) -> dict | None:
+    """Build the cached record for a response (None when the origin forbids storing it)."""
+    cc = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cc:
+        return None
+    return {
+        "html": html,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "lifetime": _freshness_lifetime(headers, cc),
+        "stale_window": _stale_window(cc),
+        "truncated": truncated,
+    }
+
+
+def _html_cache_lookup(url: str, allow_stale: bool = True) -> tuple[dict | None, tuple | None]:
+    """First half of _cached_fetch_html: return (stored_entry, ready_result).
+
+    ready_result is set for fresh hits and for entries inside their stale window
+    (cache 'stale', with a background refresh scheduled); otherwise the caller
+    fetches (conditionally when _html_validators(stored_entry) is set) and passes the
+    response to _html_cache_update.
+    """
+    cached = _html_cache.get_entry(url.strip())
+    entry = None
+    if cached is not None:
+        stored_at, entry = cached
+        age = time.time() - stored_at
+        if age <= entry["lifetime"]:
+            return entry, (entry["html"], {"cache": "hit", "truncated": entry.get("truncated", False)}, None)
+        if allow_stale and age <= entry["lifetime"] + entry.get("stale_window", _CACHE_STALE_WINDOW):
+            _schedule_refresh(url)
+            return entry, (entry["html"], {"cache": "stale", "truncated": entry.get("truncated", False)}, None)
+    return entry, None
+
+
+def _html_validators(entry: dict | None) -> dict | None:
+    return entry if entry and (entry.get("etag") or entry.get("last_modified")) else None
+
+
+def _html_cache_update(url: str, entry: dict | None, res: dict) -> tuple[str | None, dict, str | None]:
+    """Second half of _cached_fetch_html: store a fetch_url result and build (html, info, error)."""
+    key = url.strip()
+    if isinstance(res, dict) and res.get("error"):
+        return None, {"cache": "miss"}, res["error"]
+    if res.get("not_modified"):
+        if not entry:  # nothing stored to reuse; an empty body must not be cached in its place
+            return None, {"cache": "miss"}, _unsolicited_304(url)
+        headers = {"etag": entry.get("etag"), "last-modified": entry.get("last_modified")}
+        headers.update(res.get("headers") or {})
+        refreshed = _html_cache_entry(entry["html"], headers, entry.get("truncated", False))
+        if refreshed:
+            _html_cache.put(key, refreshed)
+        with _revalidation_lock:
+            _revalidation_stats["not_modified"] += 1
+        return entry["html"], {"cache": "revalidated", "truncated": entry.get("truncated", False)}, None
+    if _html_validators(entry):
+        with _revalidation_lock:
+            _revalidation_stats["modified"] += 1
+    html = res.get("content", "")
+    truncated = bool(res.get("truncated"))
+    if html:
+        new_entry = _html_cache_entry(html, res.get("headers") or {}, truncated)
+        if new_entry:
+            _html_cache.put(key, new_entry)
+    return html, {"cache": "miss", "truncated": truncated}, None
+
+
+def _cached_fetch_html(url: str) -> tuple[str | None, dict, str | None]:
+    """Return (html, info, error). info["cache"] is 'hit', 'revalidated' or 'miss';
+    info["truncated"] is True when the body was cut at WEBTOOL_FETCH_MAX_BYTES.
+
+    Fresh entries are served directly. Expired entries with an ETag / Last-Modified
+    are revalidated with a conditional GET; a 304 keeps the stored HTML (and thus
+    the parsed page, which is keyed by content hash) and renews its lifetime.
+    Concurrent misses for one URL share a single download (info["coalesced"] is
+    True for the callers that waited on another's request).
+    """
+    entry, ready = _html_cache_lookup(url)
+    if ready is not None:
+        return ready
+    result, shared = _html_flight.do(url.strip(), lambda: _html_cache_update(url, entry, fetch_url(url, validators=_html_validators(entry))))
+    return _coalesced_result(result) if shared else result
+
+
+def _coalesced_result(result: tuple) -> tuple:
+    html, info, error = result
+    return html, {**info, "coalesced": True}, error
+
+def _outline_cache_key(url: str, max_tokens: int = 0) -> str:
+    return f"outline::{url.strip()}" + (f"::{max_tokens}" if max_tokens else "")
+
+def _get_cached_outline(url: str, html: str | None = None, max_tokens: int = 0) -> tuple[str | None, bool]:
+    """Return (outline_text, stale). A stale outline (past WEBTOOL_OUTLINE_CACHE_TTL but
+    inside WEBTOOL_CACHE_STALE_WINDOW) is re-rendered from html in the background."""
+    cached = _outline_cache.get_entry(_outline_cache_key(url, max_tokens), _OUTLINE_CACHE_TTL + _CACHE_STALE_WINDOW)
+    if cached is None:
+        return None, False
+    stored_at, text = cached
+    if time.time() - stored_at <= _OUTLINE_CACHE_TTL:
+        return text, False
+    if html:
+        _schedule_refresh(url, outline=True, max_tokens=max_tokens)
+    return text, True
+
+def _store_cached_outline(url: str, text: str, max_tokens: int = 0):
+    _outline_cache.put(_outline_cache_key(url, max_tokens), text)
+    app.logger.debug(f"Stored outline cache for {url}")
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=max(1, _REFRESH_WORKERS), thread_name_prefix="webtool-refresh")
+_refresh_lock = threading.Lock()
+_refresh_inflight: set[str] = set()
+_refresh_stats = {"scheduled": 0, "refreshed": 0, "failed": 0}
+
+
+def _schedule_refresh(url: str, outline: bool = False, max_tokens: int = 0):
+    """Queue a background refresh of a stale HTML entry (and its outline when outline=True)."""
+    key = _outline_cache_key(url, max_tokens) if outline else "html::" + url.strip()
+    with _refresh_lock:
+        if key in _refresh_inflight:
+            return
+        _refresh_inflight.add(key)
+        _refresh_stats["scheduled"] += 1
+    _refresh_executor.submit(_refresh_entry, key, url, outline, max_tokens)
+
+
+def _refresh_entry(key: str, url: str, outline: bool, max_tokens: int = 0):
+    ok = False
+    try:
+        entry, ready = _html_cache_lookup(url, allow_stale=False)
+        if ready is not None:
+            html, _, error = ready
+        else:
+            # Same single-flight key as foreground misses, so concurrent refreshes and cold fetches share one request.
+            (html, _, error), _ = _html_flight.do(url.strip(), lambda: _html_cache_update(url, entry, fetch_url(url, validators=_html_validators(entry))))
+        if outline and html and not error:
+            page, _, _ = _page_model(html, url)
+            _store_cached_outline(url, _render_page(page, mode="outline", max_tokens=max_tokens), max_tokens)
+        ok = not error
+    except Exception:
+        app.logger.exception(f"background refresh of {url} failed")
+    finally:
+        with _refresh_lock:
+            _refresh_inflight.discard(key)
+            _refresh_stats["refreshed" if ok else "failed"] += 1
+
+# ------------------------------------------------------------------
+# Structured page extraction (replaces earlier simple fallback)
+# ------------------------------------------------------------------
+
+_TOKEN_EST_CHARS_PER = 4  # heuristic
+_MAX_TOKENS = int(os.getenv("WEBTOOL_MAX_TOKENS", "0"))  # default fetch_url output budget (0 = unlimited)
+_MIN_MAX_TOKENS = 200  # smaller budgets are raised to this (META and NEXT alone need ~100)
+_CHUNK_MIN_TOKENS = int(os.getenv("WEBTOOL_CHUNK_MIN_TOKENS", "50"))  # budgeted views merge smaller sections into their neighbours
+_BUDGET_META_RESERVE = 32  # tokens kept free for the META lines added after rendering (cache_status, timings, ...)
+_PAGE_LINKS_MAX = int(os.getenv("WEBTOOL_PAGE_LINKS_MAX", "1000"))  # links kept per parsed page (reachable via mode="links")
+_SECTION_PAGE_CHARS = int(os.getenv("WEBTOOL_SECTION_PAGE_CHARS", "5000"))  # section text per chunk view; the rest via next_cursor
+_LIST_PAGE_ITEMS = int(os.getenv("WEBTOOL_LIST_PAGE_ITEMS", "100"))  # links / outline lines per mode="links" / "toc" page
+_QUERY_TOP_K = 3  # sections returned inline for fetch_url(query=...) unless top_k is given
+_QUERY_TOP_K_MAX = 10
+_QUERY_HIT_CHARS = int(os.getenv("WEBTOOL_QUERY_HIT_CHARS", "2000"))  # text shown per ranked section; the rest via next_cursor
+_TERM_RE = re.compile(r"\w\w+")
+
+_HEADING_TAGS = ["h1", "h2", "h3"]
+
+_WS_RE = re.compile(r"\s+")
+_CAP_ENTITY_RE = re.compile(r"\b(?:[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b")
+_DATE_RE = re.compile(r"\b(20\d{2}|19\d{2})\b")
+_NUMBER_RE = re.compile(r"\b\d{2,}\b")
+
+
+def _now_iso():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _collapse(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _token_estimate(text: str) -> int:
+    return max(1, len(text) // _TOKEN_EST_CHARS_PER)
+
+
+class _DomIndex:
+    """Everything the extractors need from one pre-order walk of the parse tree.
+
+    ``texts`` holds the collapsed, non-empty strings ``get_text`` would see, in document
+    order; ``spans`` maps ``id(tag)`` to its ``[start, end)`` slice of ``texts`` so any
+    element's text is a join instead of another subtree walk. ``order``/``ends`` are
+    pre-order positions used for "is inside main" checks.
+    """
+
+    __slots__ = ("texts", "spans", "order", "ends", "title", "meta_description",
+                 "main", "article", "body", "headings", "anchors")
+
+    def __init__(self):
+        self.texts: list[str] = []
+        self.spans: dict[int, tuple[int, int]] = {}
+        self.order: dict[int, int] = {}
+        self.ends: dict[int, int] = {}
+        self.title: Tag | None = None
+        self.meta_description: Tag | None = None
+        self.main: Tag | None = None
+        self.article: Tag | None = None
+        self.body: Tag | None = None
+        self.headings: list[Tag] = []
+        self.anchors: list[tuple[Tag, bool]] = []  # (a[href], inside a <nav>)
+
+    def contains(self, outer: Tag, node: Tag) -> bool:
+        pos = self.order.get(id(node))
+        start = self.order.get(id(outer))
+        if pos is None or start is None:
+            return False
+        return start < pos < self.ends[id(outer)]
+
+    def text(self, node: Tag) -> str:
+        """``_collapse(node.get_text(" "))`` without re-walking the subtree."""
+        span = self.spans.get(id(node))
+        if span is None:  # script/style/template & co. collect other string types
+            return _collapse(node.get_text(" "))
+        return " ".join(self.texts[span[0]:span[1]])
+
+
+_DEFAULT_STRING_TYPES = getattr(Tag, "DEFAULT_INTERESTING_STRING_TYPES", None)
+
+
+def _index_dom(soup: Tag) -> _DomIndex:
+    """Walk the tree (or a subtree) once, iteratively, so deep pages cannot hit the recursion limit."""
+    index = _DomIndex()
+    texts = index.texts
+    spans = index.spans
+    order = index.order
+    ends = index.ends
+    default_types = _DEFAULT_STRING_TYPES
+    pos = 0
+    nav_depth = 0
+    order[id(soup)] = pos
+    stack = [(soup, iter(soup.contents), 0)]
+    while stack:
+        node, children, start = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            ends[id(node)] = pos + 1
+            if default_types is None or node.interesting_string_types == default_types:
+                spans[id(node)] = (start, len(texts))
+            if node.name == "nav":
+                nav_depth -= 1
+            continue
+        if isinstance(child, Tag):
+            pos += 1
+            order[id(child)] = pos
+            name = child.name
+            if name == "a":
+                if child.get("href") is not None:
+                    index.anchors.append((child, nav_depth > 0))
+            elif name in _HEADING_TAGS:
+                index.headings.append(child)
+            elif name == "nav":
+                nav_depth += 1
+            elif name == "meta":
+                if index.meta_description is None and child.get("name") == "description":
+                    index.meta_description = child
+            elif name == "title":
+                if index.title is None:
+                    index.title = child
+            elif name == "main":
+                if index.main is None:
+                    index.main = child
+            elif name == "article":
+                if index.article is None:
+                    index.article = child
+            elif name == "body":
+                if index.body is None:
+                    index.body = child
+            stack.append((child, iter(child.contents), len(texts)))
+        elif default_types is None or type(child) in default_types:
+            txt = _collapse(child)
+            if txt:
+                texts.append(txt)
+    return index
+
+
+# The extractors below take the _DomIndex of the page when the caller has one
+# (see _extract_page) and build one for their own subtree otherwise.
+
+def _select_main(soup: BeautifulSoup, index: _DomIndex | None = None) -> Tag:  # revised to guarantee Tag return
+    if index is None:
+        index = _index_dom(soup)
+    # BeautifulSoup itself subclasses Tag enough for our usage; cast for type checker
+    return index.main or index.article or index.body or cast(Tag, soup)
+
+
+def _extract_nav_links(soup: BeautifulSoup, base_url: str, index: _DomIndex | None = None) -> list[dict]:
+    if index is None:
+        index = _index_dom(soup)
     navs = []
-    for nav in soup.find_all(["nav"]):
-        for a in nav.find_all("a", href=True):
-            txt = _collapse(a.get_text(" "))
-            if not txt:
-                continue
-            href = urljoin(base_url, a["href"]) if a["href"] else None
-            if href:
-                navs.append({"text": txt, "url": href})
+    for a, in_nav in index.anchors:
+        if not in_nav:
+            continue
+        txt = index.text(a)
+        if not txt:
+            continue
+        href = urljoin(base_url, a["href"]) if a["href"] else None
+        if href:
+            navs.append({"text": txt, "url": href})
     # Deduplicate by (text,url)
     seen = set()
     dedup = []
@@ -540,10 +2448,12 @@ def _iter_text_nodes(node: Tag):
                 yield txt
 
 
-def _gather_links(main: Tag, base_url: str) -> list[dict]:
+def _gather_links(main: Tag, base_url: str, index: _DomIndex | None = None) -> list[dict]:
+    if index is None:
+        index = _index_dom(main)
     links = []
-    for a in main.find_all("a", href=True):
-        text = _collapse(a.get_text(" "))[:160]
+    for a in (a for a, _ in index.anchors if index.contains(main, a)):
+        text = index.text(a)[:160]
         href = urljoin(base_url, a["href"]) if a["href"] else None
         if not href or not text:
             continue
@@ -557,53 +2467,56 @@ def _gather_links(main: Tag, base_url: str) -> list[dict]:
             continue
         seen.add(key)
         out.append(l)
-    return out[:200]
+    return out[:_PAGE_LINKS_MAX]
 
 
-def _extract_headings(main: Tag) -> list[dict]:
+def _extract_headings(main: Tag, index: _DomIndex | None = None) -> list[dict]:
+    if index is None:
+        index = _index_dom(main)
     headings = []
-    for tag in main.find_all(_HEADING_TAGS):
+    for tag in (h for h in index.headings if index.contains(main, h)):
         level = int(tag.name[1])
-        title = _collapse(tag.get_text(" "))
+        title = index.text(tag)
         if not title:
             continue
         headings.append({"level": level, "title": title, "tag": tag})
     return headings
 
 
-def _build_chunks(headings: list[dict], main: Tag) -> list[dict]:
+def _build_chunks(headings: list[dict], main: Tag, index: _DomIndex | None = None) -> list[dict]:
+    """One chunk per heading: the text of the heading's following siblings, read from the index.
+
+    A section runs from its heading to the next h1-h3 sibling, so no structural
+    ``Tag.__eq__`` comparisons against the next heading are needed.
+    """
+    if index is None:
+        index = _index_dom(main)
     if not headings:
         # single chunk of all text
-        text = _collapse(main.get_text(" "))
-        return [{"id": "sec-1", "heading": "Document", "level": 1, "text": text}]
+        text = index.text(main)
+        return [{"id": "sec-1", "heading": "Document", "level": 1, "text": text,
+                 "tokens": _token_estimate(text)}]
     chunks = []
     for idx, h in enumerate(headings):
-        start_tag = h["tag"]
-        # Determine stop boundary
-        stop_tags = []
-        for nxt in headings[idx + 1:]:
-            if nxt["level"] <= h["level"]:
-                stop_tags.append(nxt["tag"])
-                break
         texts = []
-        cur = start_tag.next_sibling
-        while cur and (not stop_tags or cur != stop_tags[0]):
+        cur = h["tag"].next_sibling
+        while cur is not None:
             if isinstance(cur, Tag):
-                # Skip further headings entirely
                 if cur.name in _HEADING_TAGS:
                     break
-                txt = _collapse(cur.get_text(" "))
-                if txt:
-                    texts.append(txt)
+                txt = index.text(cur)
             elif isinstance(cur, NavigableString):
-                txt = _collapse(str(cur))
-                if txt:
-                    texts.append(txt)
+                if not cur:
+                    break  # an empty string sibling ends the section, as it always has
+                txt = _collapse(cur)
+            else:
+                txt = ""
+            if txt:
+                texts.append(txt)
             cur = cur.next_sibling
         body_text = " \n".join(texts).strip()
-        chunk_id = f"sec-{idx+1}"
         chunks.append({
-            "id": chunk_id,
+            "id": f"sec-{idx+1}",
             "heading": h["title"],
             "level": h["level"],
             "text": body_text,
@@ -612,128 +2525,584 @@ def _build_chunks(headings: list[dict], main: Tag) -> list[dict]:
     return chunks
 
 
-def _derive_outline(chunks: list[dict]) -> list[str]:
-    lines = []
-    for c in chunks:
-        indent = "  " * (c["level"] - 1)
-        lines.append(f"{indent}{c['id']} {c['heading']}")
-    return lines
+def _derive_outline(chunks: list[dict]) -> list[str]:
+    lines = []
+    for c in chunks:
+        indent = "  " * (c["level"] - 1)
+        lines.append(f"{indent}{c['id']} {c['heading']}")
+    return lines
+
+
+def _keypoints(chunks: list[dict]) -> list[str]:
+    points = []
+    for c in chunks[:8]:  # limit initial extraction
+        if not c["text"]:
+            continue
+        # Take first sentence-like fragment
+        frag = c["text"].split(".")[0][:180]
+        if frag:
+            points.append(f"{c['heading']}: {frag.strip()}.")
+    return points[:12]
+
+
+def _entities(full_text: str) -> dict:
+    people_orgs = list(dict.fromkeys(_CAP_ENTITY_RE.findall(full_text)))[:25]
+    years = list(dict.fromkeys(_DATE_RE.findall(full_text)))[:10]
+    numbers = list(dict.fromkeys(_NUMBER_RE.findall(full_text)))[:15]
+    return {"names": people_orgs, "years": years, "numbers": numbers}
+
+
+def _snippets(chunks: list[dict]) -> list[str]:
+    out = []
+    for c in chunks[:10]:
+        if not c["text"]:
+            continue
+        snippet = c["text"][:260].strip()
+        out.append(f"[{c['id']}] {snippet}...")
+    return out
+
+
+# Link / URL cleanup helpers
+_GOOGLE_NEWS_ARTICLE_RE = re.compile(r"https://news\.google\.com/rss/articles/")
+
+def _cleanup_link(url: str) -> str:
+    # For Google News redirect-style article URLs keep as-is (cannot easily unwrap w/out fetch), but remove trailing query params except required 'oc=5'
+    if _GOOGLE_NEWS_ARTICLE_RE.match(url):
+        # Preserve only base + optional ?oc=5
+        base, _, query = url.partition('?')
+        if 'oc=5' in query:
+            return base + '?oc=5'
+        return base
+    return url
+
+
+def _parse_page(html: str, url: str, parser: str | None = None) -> dict:
+    """Parse HTML once into the page model every fetch_url view is rendered from."""
+    with _span("parse", bytes=len(html)):
+        soup = _make_soup(html, parser)
+    with _span("extract"):
+        return _extract_page(soup, url)
+
+
+def _extract_page(soup: BeautifulSoup, url: str) -> dict:
+    index = _index_dom(soup)
+    title = _collapse(index.title.get_text()) if index.title is not None else ""
+    meta_desc = ""
+    md = index.meta_description
+    if isinstance(md, Tag):
+        content = md.get("content")
+        if isinstance(content, str):
+            meta_desc = _collapse(content)
+    main = _select_main(soup, index)
+    headings = _extract_headings(main, index)
+    chunks = _build_chunks(headings, main, index)
+    full_text = " \n".join(c["text"] for c in chunks if c.get("text"))
+    return {
+        "url": url,
+        "title": title,
+        "description": meta_desc,
+        "headings": [{"level": h["level"], "title": h["title"]} for h in headings],
+        "chunks": chunks,
+        "links": _gather_links(main, url, index),
+        "nav": _extract_nav_links(soup, url, index),
+        "outline": _derive_outline(chunks),
+        "entities": _entities(full_text),
+    }
+
+
+def _page_model(html: str, url: str) -> tuple[dict, bool, bool]:
+    """Return (page_model, cache_hit, coalesced). Keyed by URL + parser backend + content hash so identical HTML is parsed once.
+
+    coalesced is True when this caller waited on another caller's in-flight parse.
+    The returned model is shared between callers; treat it as read-only.
+    """
+    digest = hashlib.sha1(html.encode("utf-8", "surrogatepass")).hexdigest()
+    key = f"{url.strip()}::{_parser_backend()}::{digest}"  # backends repair malformed markup differently
+    page = _page_cache.get(key, _PAGE_CACHE_TTL)
+    if page is not None:
+        return page, True, False
+
+    def parse():
+        start = time.perf_counter()
+        parsed = _parse_page(html, url)
+        _metrics.observe("webtool_parse_duration_seconds", time.perf_counter() - start)
+        _page_cache.put(key, parsed)
+        if _page_index is not None:
+            _page_index.add(url, digest, parsed)
+        return parsed
+
+    page, shared = _parse_flight.do(key, parse)  # concurrent callers with the same HTML share one parse
+    return page, False, shared
+
+
+# ------------------------------------------------------------------
+# HTML parser backend (lxml when installed and equivalent, else html.parser)
+# ------------------------------------------------------------------
+
+_HTML_PARSER = os.getenv("WEBTOOL_HTML_PARSER", "auto").strip().lower()  # auto | lxml | html5lib | html.parser
+_PARSER_SELFTEST = os.getenv("WEBTOOL_PARSER_SELFTEST", "1") != "0"
+_PARSER_REFERENCE = "html.parser"
+# Checked-in pages mimicking real site markup (docs, news, wiki, ...); when present they
+# join the self-test page in the equivalence check.
+_PARSER_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "corpus")
+_parser_choice: tuple[str, dict] | None = None
+_parser_choice_lock = threading.Lock()
+
+# Well-formed sample exercising what the extractors rely on (nesting, nav,
+# comments, scripts, entities); repeated to a realistic size for the
+# equivalence check and benchmark.
+_PARSER_SELFTEST_SECTION = """<h1>Getting Started</h1><p>Webtool MCP was released in 2024 by Example Labs. It handles 12000 pages.</p>
+<p>Install it with <a href="install.html">the installer</a> &mdash; or <code>pip</code>.</p>
+<!-- build note -->
+<h2>Configuration</h2><ul><li>Set <a href="#env">environment</a> variables</li><li>Restart</li></ul>
+<section><h2>Caching</h2><p>Pages are cached for 300 seconds.</p>
+<h3>Disk Tier</h3><p>SQLite backed; see <a href="https://sqlite.org/wal.html">WAL mode</a>.</p></section>
+<table><tbody><tr><td>Engine</td><td>Latency 250 ms</td></tr></tbody></table>
+<h2>FAQ</h2><p>Questions from New York and San Francisco users.</p><script>var tracking = 1;</script>
+"""
+
+
+def _parser_selftest_html(sections: int = 20) -> str:
+    return (
+        '<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8"><title>Self test &amp; benchmark</title>'
+        '<meta name="description" content="Parser  equivalence sample"></head>\n'
+        '<body><header><nav><a href="/">Home</a> <a href="/docs/">Docs</a><a href="/blog">Blog</a></nav></header>\n'
+        f"<main>{_PARSER_SELFTEST_SECTION * sections}</main>\n"
+        '<footer><nav><a href="/about">About</a></nav></footer></body></html>'
+    )
+
+
+def _make_soup(html: str, parser: str | None = None) -> BeautifulSoup:
+    return BeautifulSoup(html, parser or _parser_backend())
+
+
+def _parser_corpus() -> list[str]:
+    try:
+        names = sorted(n for n in os.listdir(_PARSER_CORPUS_DIR) if n.endswith(".html"))
+        return [open(os.path.join(_PARSER_CORPUS_DIR, n), encoding="utf-8").read() for n in names]
+    except OSError:
+        return []
+
+
+def _benchmark_parsers(html: str | None = None, candidates: tuple[str, ...] = ("lxml", "html5lib", _PARSER_REFERENCE), repeat: int = 3) -> dict:
+    """Time tree construction per available backend and compare its page models with html.parser's.
+
+    Equivalence is checked on the self-test page and the corpus pages. Backends repair
+    broken markup differently, which the per-backend page cache keys account for.
+    Returns {backend: {"available", "parse_ms", "equivalent"}}; unavailable backends
+    only carry available=False.
+    """
+    html = html or _parser_selftest_html()
+    url = "https://selftest.invalid/page"
+    samples = (html, *_parser_corpus())
+    reference = [_parse_page(sample, url, _PARSER_REFERENCE) for sample in samples]
+    report: dict[str, dict] = {}
+    for name in candidates:
+        try:
+            models = reference if name == _PARSER_REFERENCE else [_parse_page(sample, url, name) for sample in samples]
+        except FeatureNotFound:
+            report[name] = {"available": False}
+            continue
+        start = time.perf_counter()
+        for _ in range(repeat):
+            _make_soup(html, name)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        report[name] = {"available": True, "parse_ms": round(elapsed_ms, 3), "equivalent": models == reference}
+    return report
+
+
+def _select_parser_backend() -> tuple[str, dict]:
+    """Pick the backend from WEBTOOL_HTML_PARSER.
+
+    auto = lxml when it is installed and its page models match html.parser's on the
+    self-test and corpus pages, else html.parser. The choice never
+    depends on timings, so every worker process picks the same backend; parse_ms is
+    reported for information only. An explicit backend is used when installed.
+    """
+    if not _PARSER_SELFTEST and _HTML_PARSER == "auto":
+        return _PARSER_REFERENCE, {}
+    candidates = ("lxml", _PARSER_REFERENCE) if _HTML_PARSER == "auto" else tuple(dict.fromkeys((_HTML_PARSER, _PARSER_REFERENCE)))
+    try:
+        report = _benchmark_parsers(candidates=candidates)
+    except Exception as exc:  # never block startup on the self-test
+        app.logger.warning(f"parser self-benchmark failed, using {_PARSER_REFERENCE}: {exc}")
+        return _PARSER_REFERENCE, {}
+    if _HTML_PARSER != "auto":
+        if report.get(_HTML_PARSER, {}).get("available"):
+            return _HTML_PARSER, report
+        app.logger.warning(f"WEBTOOL_HTML_PARSER={_HTML_PARSER} is not installed; using {_PARSER_REFERENCE}")
+        return _PARSER_REFERENCE, report
+    lxml = report.get("lxml", {})
+    return ("lxml" if lxml.get("available") and lxml.get("equivalent") else _PARSER_REFERENCE), report
+
+
+def _parser_selection() -> tuple[str, dict]:
+    """(backend, self-test report), chosen once per process on first use rather than at import."""
+    global _parser_choice
+    if _parser_choice is None:
+        with _parser_choice_lock:
+            if _parser_choice is None:
+                _parser_choice = _select_parser_backend()
+                app.logger.info(f"html parser backend: {_parser_choice[0]} {_parser_choice[1]}")
+    return _parser_choice
+
+
+def _parser_backend() -> str:
+    return _parser_selection()[0]
+
+# ------------------------------------------------------------------
+# Token budget (max_tokens)
+# ------------------------------------------------------------------
+
+def _max_tokens(arguments) -> int:
+    """Output budget for this call: the `max_tokens` argument, else WEBTOOL_MAX_TOKENS (0 = unlimited)."""
+    value = (arguments or {}).get("max_tokens", _MAX_TOKENS) if isinstance(arguments, dict) else _MAX_TOKENS
+    try:
+        budget = int(value or 0)
+    except (TypeError, ValueError):
+        budget = _MAX_TOKENS
+    return max(budget, _MIN_MAX_TOKENS) if budget > 0 else 0
+
+
+def _chunk_limit(max_tokens: int) -> int:
+    """Largest section (tokens) a budgeted view keeps whole, leaving room for META/OUTLINE around it."""
+    return max(2 * _CHUNK_MIN_TOKENS, max_tokens * 3 // 4)
+
+
+def _chunk_index_line(c: dict) -> str:
+    line = f"{c['id']} lvl={c['level']} tokens~{c['tokens']} {c['heading'][:120]}"
+    if c.get("merged"):
+        line += f" (+{', '.join(c['merged'])})"
+    return line
+
+
+def _split_text(text: str, max_chars: int) -> list[str]:
+    """Cut text into pieces of at most max_chars at paragraph breaks, else sentence ends, else spaces."""
+    paras = []
+    for para in text.split(" \n"):
+        while len(para) > max_chars:
+            cut = para.rfind(". ", 0, max_chars) + 1
+            if cut <= 0:
+                cut = para.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            paras.append(para[:cut].rstrip())
+            para = para[cut:].lstrip()
+        paras.append(para)
+    pieces, cur = [], ""
+    for para in paras:
+        if cur and len(cur) + 2 + len(para) > max_chars:
+            pieces.append(cur)
+            cur = para
+        else:
+            cur = f"{cur} \n{para}" if cur else para
+    if cur or not pieces:
+        pieces.append(cur)
+    return pieces
+
+
+def _rebalance_chunks(chunks: list[dict], limit: int, min_tokens: int = _CHUNK_MIN_TOKENS) -> list[dict]:
+    """Merge runs of small adjacent sections and split sections larger than limit tokens.
+
+    A section is merged into the previous one when either is below min_tokens, the result
+    stays within limit and it is not a higher-level heading (an h2 never joins an h3 run).
+    The merged chunk keeps the first id and lists the others under "merged". Oversized
+    sections are cut at paragraph breaks into sec-N.1, sec-N.2, ... with "part_of": "sec-N".
+    Every original id therefore still resolves through _find_chunk.
+    """
+    merged: list[dict] = []
+    for c in chunks:
+        last = merged[-1] if merged else None
+        if (last is not None and c["level"] >= last["level"] and last["tokens"] + c["tokens"] <= limit
+                and (last["tokens"] < min_tokens or c["tokens"] < min_tokens)):
+            text = " \n".join(t for t in (last["text"], c["heading"], c["text"]) if t)
+            last.update(text=text, tokens=_token_estimate(text), merged=[*last.get("merged", []), c["id"]])
+            continue
+        merged.append(dict(c))
+    out = []
+    for c in merged:
+        if c["tokens"] <= limit:
+            out.append(c)
+            continue
+        parts = _split_text(c["text"], limit * _TOKEN_EST_CHARS_PER)
+        for i, text in enumerate(parts, 1):
+            heading = c["heading"] if i == 1 else f"{c['heading']} (part {i}/{len(parts)})"
+            out.append({**c, "id": f"{c['id']}.{i}", "heading": heading, "text": text, "tokens": _token_estimate(text), "part_of": c["id"]})
+    return out
+
+
+def _find_chunk(chunks: list[dict], chunk_id: str) -> dict | None:
+    """Look up a section by id, also resolving ids merged into another chunk or split into parts."""
+    cid = str(chunk_id).strip().lower()
+    for c in chunks:
+        if c["id"].lower() == cid:
+            return c
+    for c in chunks:
+        if (c.get("part_of") or "").lower() == cid or cid in (m.lower() for m in c.get("merged", ())):
+            return c
+    if "." in cid:  # a sec-N.M part id from a budgeted view, asked for without (or with another) budget
+        return _find_chunk(chunks, cid.split(".", 1)[0])
+    return None
+
+
+# ------------------------------------------------------------------
+# Cursor paging (offset / cursor / next_cursor)
+# ------------------------------------------------------------------
+
+def _url_tag(url: str) -> str:
+    return hashlib.sha1(url.strip().encode("utf-8")).hexdigest()[:10]
+
+
+def _encode_cursor(url: str, view: str, offset: int, chunk_id: str | None = None) -> str:
+    """Opaque continuation token: which view of which page, and where the next page starts."""
+    state = {"u": _url_tag(url), "v": view, "o": offset}
+    if chunk_id:
+        state["c"] = chunk_id
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
 
-def _keypoints(chunks: list[dict]) -> list[str]:
-    points = []
-    for c in chunks[:8]:  # limit initial extraction
-        if not c["text"]:
-            continue
-        # Take first sentence-like fragment
-        frag = c["text"].split(".")[0][:180]
-        if frag:
-            points.append(f"{c['heading']}: {frag.strip()}.")
-    return points[:12]
+def _decode_cursor(token: str, url: str) -> dict:
+    """Inverse of _encode_cursor; ValueError when the token is malformed or belongs to another URL."""
+    try:
+        raw = base64.urlsafe_b64decode(str(token).strip() + "=" * (-len(str(token).strip()) % 4))
+        state = json.loads(raw)
+        view, offset = state["v"], int(state["o"])
+    except Exception:
+        raise ValueError("malformed cursor") from None
+    if state.get("u") != _url_tag(url):
+        raise ValueError("cursor belongs to a different url; pass the url it was returned for")
+    if view not in ("chunk", "links", "toc") or offset < 0:
+        raise ValueError("malformed cursor")
+    return {"view": view, "offset": offset, "chunk_id": state.get("c")}
 
 
-def _entities(full_text: str) -> dict:
-    people_orgs = list(dict.fromkeys(_CAP_ENTITY_RE.findall(full_text)))[:25]
-    years = list(dict.fromkeys(_DATE_RE.findall(full_text)))[:10]
-    numbers = list(dict.fromkeys(_NUMBER_RE.findall(full_text)))[:15]
-    return {"names": people_orgs, "years": years, "numbers": numbers}
+def _paging_args(arguments, url: str) -> tuple[str | None, str | None, int]:
+    """(chunk_id, mode, offset) from `cursor` (which wins) or `chunk_id`/`section`, `mode` and `offset`."""
+    arguments = arguments if isinstance(arguments, dict) else {}
+    if arguments.get("cursor"):
+        state = _decode_cursor(arguments["cursor"], url)
+        if state["view"] == "chunk":
+            return state["chunk_id"], None, state["offset"]
+        return None, state["view"], state["offset"]
+    try:
+        offset = max(0, int(arguments.get("offset") or 0))
+    except (TypeError, ValueError):
+        raise ValueError(f"offset must be a non-negative integer, got {arguments.get('offset')!r}") from None
+    return arguments.get("chunk_id") or arguments.get("section"), arguments.get("mode"), offset
 
 
-def _snippets(chunks: list[dict]) -> list[str]:
-    out = []
-    for c in chunks[:10]:
-        if not c["text"]:
-            continue
-        snippet = c["text"][:260].strip()
-        out.append(f"[{c['id']}] {snippet}...")
-    return out
+def _text_page(text: str, offset: int, size: int) -> tuple[str, int]:
+    """Slice text[offset:] to at most size chars, ending at a paragraph break or space. Returns (piece, end)."""
+    end = offset + size
+    if end >= len(text):
+        return text[offset:], len(text)
+    cut = text.rfind("\n", offset + size // 2, end)
+    if cut < 0:
+        cut = text.rfind(" ", offset + size // 2, end)
+    end = cut + 1 if cut >= 0 else end
+    return text[offset:end], end
 
 
-# Link / URL cleanup helpers
-_GOOGLE_NEWS_ARTICLE_RE = re.compile(r"https://news\.google\.com/rss/articles/")
+def _more_line(url: str, view: str, shown: int, total: int) -> list[str]:
+    """'(+N more; next_cursor: ...)' under a capped LINKS / OUTLINE list, or nothing when it is complete."""
+    if total <= shown:
+        return []
+    return [f"(+{total - shown} more; next_cursor: {_encode_cursor(url, view, shown)})"]
 
-def _cleanup_link(url: str) -> str:
-    # For Google News redirect-style article URLs keep as-is (cannot easily unwrap w/out fetch), but remove trailing query params except required 'oc=5'
-    if _GOOGLE_NEWS_ARTICLE_RE.match(url):
-        # Preserve only base + optional ?oc=5
-        base, _, query = url.partition('?')
-        if 'oc=5' in query:
-            return base + '?oc=5'
-        return base
-    return url
+
+# ------------------------------------------------------------------
+# Query-focused section ranking (fetch_url query=...)
+# ------------------------------------------------------------------
+
+def _top_k(arguments) -> int:
+    """Sections to return inline for a query: the `top_k` argument, else _QUERY_TOP_K (capped)."""
+    value = (arguments or {}).get("top_k", _QUERY_TOP_K) if isinstance(arguments, dict) else _QUERY_TOP_K
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = _QUERY_TOP_K
+    return max(1, min(count, _QUERY_TOP_K_MAX))
+
+
+def _rank_chunks(chunks: list[dict], query: str, k1: float = 1.2, b: float = 0.75) -> list[tuple[float, dict]]:
+    """Score every section against query with BM25 (IDF taken from this page's sections).
+
+    One tokenizing pass per section that only counts query terms; headings count twice.
+    Returns (score, chunk) for sections matching at least one term, best first
+    (ties keep document order).
+    """
+    terms = set(_TERM_RE.findall(query.lower()))
+    if not terms or not chunks:
+        return []
+    docs = []
+    df: Counter = Counter()
+    for c in chunks:
+        words = _TERM_RE.findall(f"{c['heading']} {c['heading']} {c['text']}".lower())
+        tf = Counter(w for w in words if w in terms)
+        docs.append((c, tf, len(words)))
+        df.update(tf.keys())
+    avg_len = sum(n for _, _, n in docs) / len(docs) or 1.0
+    idf = {t: math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5)) for t in terms}
+    scored = []
+    for c, tf, n in docs:
+        score = sum(idf[t] * f * (k1 + 1) / (f + k1 * (1 - b + b * n / avg_len)) for t, f in tf.items())
+        if score > 0:
+            scored.append((score, c))
+    scored.sort(key=lambda item: -item[0])
+    return scored
+
+
+def _fit_sections(sections: list[tuple[list[str], int | None]], max_tokens: int) -> list[str]:
+    """Flatten (lines, priority) sections, trimming lines from the end until max_tokens fits.
+
+    Sections with the highest priority number are trimmed first and None is never trimmed.
+    A trimmed section keeps its first line (the header), may end with a shortened line,
+    and gets a note saying how much was cut. max_tokens=0 only flattens.
+    """
+    if not max_tokens:
+        return [line for lines, _ in sections for line in lines]
+    budget = max_tokens * _TOKEN_EST_CHARS_PER
+    target = budget - 64  # room for the trim note
+    out = [list(lines) for lines, _ in sections]
+    size = sum(len(line) + 1 for lines in out for line in lines)
+    trimmable = sorted((i for i, (_, prio) in enumerate(sections) if prio is not None), key=lambda i: -sections[i][1])
+    for i in trimmable:
+        if size <= budget:
+            break
+        lines = out[i]
+        tail = []
+        while lines and lines[-1] == "":
+            tail.append(lines.pop())
+        dropped, shortened = 0, False
+        while lines and size > target:
+            line = lines[-1]
+            keep = len(line) - (size - target)
+            if keep >= 80:  # keep the start of a long paragraph rather than dropping it
+                cut = line.rfind(" ", 0, keep)
+                lines[-1] = line[:cut if cut > 0 else keep] + " …"
+                size -= len(line) - len(lines[-1])
+                shortened = True
+                break
+            if len(lines) == 1:
+                break
+            size -= len(lines.pop()) + 1
+            dropped += 1
+        if dropped or shortened:
+            note = "(trimmed to fit max_tokens" + (f"; {dropped} more line(s) omitted)" if dropped else ")")
+            lines.append(note)
+            size += len(note) + 1
+        lines.extend(tail)
+    return [line for lines in out for line in lines]
 
 
-def format_structured_page(html: str, url: str, chunk_id: str | None = None, mode: str | None = None) -> str:
+def format_structured_page(html: str, url: str, chunk_id: str | None = None, mode: str | None = None, max_tokens: int = 0, offset: int = 0,
+                           query: str | None = None, top_k: int = _QUERY_TOP_K) -> str:
     """Return structured multi-section text for LLM consumption.
     Sections: META, OUTLINE, KEYPOINTS, ENTITIES, LINKS, NAV, SNIPPETS, CHUNKS, NEXT
     If chunk_id provided, return focused chunk view plus minimal META/OUTLINE context.
+    max_tokens > 0 rebalances sections and trims the view to that budget; offset pages
+    through a long section (chunk view) or the full LINKS / OUTLINE lists (mode "links" / "toc").
+    A query (without chunk_id) returns the top_k sections ranked against it instead.
     """
-    # (We re-use existing implementation but add early outline-only branch)
-    # NOTE: This edit only appends outline mode handling at the start.
     if not html:
         return f"META\nsource: {url}\nstatus: empty\n\n"
-    soup = BeautifulSoup(html, "html.parser")
-    title = _collapse(soup.title.get_text()) if soup.title else ""
-    meta_desc = ""
-    md = soup.find("meta", attrs={"name": "description"})
-    if isinstance(md, Tag):
-        content = md.get("content")
-        if isinstance(content, str):
-            meta_desc = _collapse(content)
-    main = _select_main(soup)
-    headings = _extract_headings(main)
-    chunks = _build_chunks(headings, main)
-    full_text = " \n".join(c["text"] for c in chunks if c.get("text"))
-    links = _gather_links(main, url)
-    nav_links = _extract_nav_links(soup, url)
-    outline_lines = _derive_outline(chunks)
+    page, _, _ = _page_model(html, url)
+    return _render_page(page, chunk_id=chunk_id, mode=mode, max_tokens=max_tokens, offset=offset, query=query, top_k=top_k)
+
+
+def _render_page(page: dict, chunk_id: str | None = None, mode: str | None = None, max_tokens: int = 0, offset: int = 0,
+                 query: str | None = None, top_k: int = _QUERY_TOP_K) -> str:
+    """Render a parsed page model (see _parse_page) as outline, focused chunk or global view,
+    one page of its links / outline (mode "links" / "toc", starting at item `offset`), or,
+    with a query, the top_k best-matching sections inline (see _rank_chunks).
+
+    With max_tokens, sections are rebalanced for that budget (see _rebalance_chunks) and the
+    view is trimmed to fit it (see _fit_sections); 0 renders the full, unbudgeted view.
+    In the chunk view `offset` is a character offset into the section text.
+    """
+    url = page["url"]
+    title = page["title"]
+    meta_desc = page["description"]
+    chunks = _rebalance_chunks(page["chunks"], _chunk_limit(max_tokens)) if max_tokens else page["chunks"]
+    links = page["links"]
+    nav_links = page["nav"]
+    outline_lines = page["outline"]
+    meta = ["META", f"source: {url}", f"fetched_at: {_now_iso()}", f"title: {title}", f"description: {meta_desc}" if meta_desc else "", ""]
+
+    if mode in ("links", "toc"):
+        items = [f"[L{i}] {l['text']} — {l['url']}" for i, l in enumerate(links, 1)] if mode == "links" else outline_lines
+        end = min(offset + _LIST_PAGE_ITEMS, len(items))
+        next_cursor = _encode_cursor(url, mode, end) if end < len(items) else "-"
+        sections = [
+            (meta, None),
+            (["PAGE", f"items: {offset + 1 if end > offset else 0}-{end} of {len(items)}", f"next_cursor: {next_cursor}", ""], None),
+            (["LINKS" if mode == "links" else "OUTLINE", *(items[offset:end] or ["(none)"]), ""], 1),
+            (["NEXT", "Follow a link (e.g. L5) or request a section id; pass next_cursor (same url) for the next page."], None),
+        ]
+        return "\n".join([p for p in _fit_sections(sections, max_tokens) if p is not None])
+
+    if query and not chunk_id:
+        ranked = _rank_chunks(chunks, query)
+        if max_tokens:  # each inline section costs a ~30-token header; leave room for its text
+            top_k = max(1, min(top_k, max_tokens // 200))
+        sections = [
+            (meta, None),
+            (["QUERY", f"query: {query}", f"matched: {len(ranked)} of {len(chunks)} sections", ""], None),
+            (["RANKED", *([f"{c['id']} score={score:.2f} {c['heading'][:120]}" for score, c in ranked[:10]] or ["(no section matches the query)"]), ""], 1),
+        ]
+        for rank, (score, c) in enumerate(ranked[:top_k], 1):
+            text, end = _text_page(c["text"], 0, _QUERY_HIT_CHARS)
+            head = ["CHUNK", f"id: {c['id']}", f"heading: {c['heading']}", f"level: {c['level']}", f"score: {score:.2f}", f"tokens_est: {c['tokens']}"]
+            if end < len(c["text"]):
+                head.extend([f"range: chars 0-{end} of {len(c['text'])}", f"next_cursor: {_encode_cursor(url, 'chunk', end, c['id'])}"])
+            sections.extend([(head, None), (["", *text.split("\n"), ""], rank + 1)])  # lower-ranked text is trimmed first
+        sections.extend([
+            (["OUTLINE", *outline_lines[:40], ""], 20),
+            (["NEXT", "Open another ranked section by id (e.g. sec-2), continue one with its next_cursor, or follow a link (e.g. L5)."], None),
+        ])
+        return "\n".join([p for p in _fit_sections(sections, max_tokens) if p is not None])
 
     if mode == 'outline':
         link_lines = []
         for i, l in enumerate(links[:40], 1):
             link_lines.append(f"[L{i}] {l['text']} — {l['url']}")
-        chunk_index_lines = [f"{c['id']} lvl={c['level']} tokens~{c['tokens']} {c['heading'][:120]}" for c in chunks[:60]]
-        parts = [
-            'META', f'source: {url}', f'fetched_at: {_now_iso()}', f'title: {title}', f'description: {meta_desc}' if meta_desc else '', '',
-            'OUTLINE', *outline_lines[:80], '', 'LINKS', *(link_lines or ['(none)']), '', 'CHUNKS', *chunk_index_lines, '', 'NEXT', 'Request a section id (e.g. sec-2) or follow a link (e.g. L5).']
-        return "\n".join([p for p in parts if p])
+        chunk_index_lines = [_chunk_index_line(c) for c in chunks[:60]]
+        # (lines, trim priority): the highest priority is trimmed first, None never
+        sections = [
+            (meta, None),
+            (['OUTLINE', *outline_lines[:80], *_more_line(url, "toc", 80, len(outline_lines)), ''], 1),
+            (['LINKS', *(link_lines or ['(none)']), *_more_line(url, "links", 40, len(links)), ''], 3),
+            (['CHUNKS', *chunk_index_lines, ''], 2),
+            (['NEXT', 'Request a section id (e.g. sec-2) or follow a link (e.g. L5).'], None),
+        ]
+        return "\n".join([p for p in _fit_sections(sections, max_tokens) if p])
 
     # Focus mode if chunk_id requested
-    focus_chunk = None
-    if chunk_id:
-        focus_chunk = next((c for c in chunks if c["id"].lower() == chunk_id.lower()), None)
-
-    outline_lines = _derive_outline(chunks)
+    focus_chunk = _find_chunk(chunks, chunk_id) if chunk_id else None
 
     if focus_chunk:
         neighbor_ids = [c["id"] for c in chunks]
         idx = neighbor_ids.index(focus_chunk["id"]) if focus_chunk["id"] in neighbor_ids else -1
         prev_id = neighbor_ids[idx-1] if idx > 0 else None
         next_id = neighbor_ids[idx+1] if idx >= 0 and idx < len(neighbor_ids)-1 else None
-        parts = [
-            "META",
-            f"source: {url}",
-            f"fetched_at: {_now_iso()}",
-            f"title: {title}",
-            f"description: {meta_desc}" if meta_desc else "",
-            "",
-            "OUTLINE",
-            *outline_lines[:40],
-            "",
+        chunk_head = [
             "CHUNK",
             f"id: {focus_chunk['id']}",
             f"heading: {focus_chunk['heading']}",
             f"level: {focus_chunk['level']}",
             f"tokens_est: {focus_chunk['tokens']}",
-            "",
-            focus_chunk["text"][:5000],
-            "",
-            "NEIGHBORS",
-            f"previous: {prev_id or '-'}",
-            f"next: {next_id or '-'}",
-            "",
-            "LINKS (local excerpt)",
         ]
+        if focus_chunk.get("merged"):
+            chunk_head.append(f"merged: {', '.join(focus_chunk['merged'])}")
+        if focus_chunk.get("part_of"):
+            chunk_head.append(f"part_of: {focus_chunk['part_of']}")
+        full_text = focus_chunk["text"]
+        page_chars = _chunk_limit(max_tokens) * _TOKEN_EST_CHARS_PER if max_tokens else _SECTION_PAGE_CHARS
+        text, end = _text_page(full_text, min(offset, len(full_text)), page_chars)
+        if offset or end < len(full_text):
+            next_cursor = _encode_cursor(url, "chunk", end, focus_chunk["id"]) if end < len(full_text) else "-"
+            chunk_head.extend([f"range: chars {min(offset, len(full_text))}-{end} of {len(full_text)}", f"next_cursor: {next_cursor}"])
         # limited links inside focus text
         local_links = []
         if links:
@@ -741,20 +3110,25 @@ def format_structured_page(html: str, url: str, chunk_id: str | None = None, mod
                 if len(local_links) >= 40:
                     break
                 # naive filter: if link text appears in chunk text
-                if l["text"] and l["text"] in focus_chunk["text"]:
+                if l["text"] and l["text"] in text:
                     local_links.append(f"[L{i}] {l['text']} — {l['url']}")
-        parts.extend(local_links or ["(none)"])
-        parts.extend([
-            "",
-            "NEXT",
-            "You can request another section by id (e.g. sec-2) or follow a link (e.g. L5).",
-        ])
-        return "\n".join([p for p in parts if p is not None])
+        # Split by line under a budget so trimming can stop mid-section.
+        text_lines = text.split("\n") if max_tokens else [text]
+        sections = [
+            (meta, None),
+            (["OUTLINE", *outline_lines[:40], ""], 2),
+            (chunk_head, None),
+            (["", *text_lines, ""], 1),  # the leading blank is the "header" _fit_sections keeps, so all text can go
+            (["NEIGHBORS", f"previous: {prev_id or '-'}", f"next: {next_id or '-'}", ""], None),
+            (["LINKS (local excerpt)", *(local_links or ["(none)"]), ""], 3),
+            (["NEXT", "You can request another section by id (e.g. sec-2) or follow a link (e.g. L5)."], None),
+        ]
+        return "\n".join([p for p in _fit_sections(sections, max_tokens) if p is not None])
 
     # Global view
-    kp = _keypoints(chunks)
-    ents = _entities(full_text)
-    snips = _snippets(chunks)
+    kp = _keypoints(page["chunks"])
+    ents = page["entities"]
+    snips = _snippets(page["chunks"])
 
     link_lines = []
     for i, l in enumerate(links[:120], 1):
@@ -762,363 +3136,584 @@ def format_structured_page(html: str, url: str, chunk_id: str | None = None, mod
 
     nav_lines = [f"• {n['text']} — {n['url']}" for n in nav_links[:40]]
 
-    chunk_index_lines = [
-        f"{c['id']} lvl={c['level']} tokens~{c['tokens']} {c['heading'][:120]}" for c in chunks[:80]
-    ]
+    chunk_index_lines = [_chunk_index_line(c) for c in chunks[:80]]
 
-    parts = [
-        "META",
-        f"source: {url}",
-        f"fetched_at: {_now_iso()}",
-        f"title: {title}",
-        f"description: {meta_desc}" if meta_desc else "",
-        "",
-        "OUTLINE",
-        *outline_lines[:80],
-        "",
-        "KEYPOINTS",
-        *(kp or ["(none extracted)"]),
-        "",
-        "ENTITIES",
-        f"names: {', '.join(ents['names'])}" if ents.get("names") else "names: (none)",
-        f"years: {', '.join(ents['years'])}" if ents.get("years") else "years: (none)",
-        f"numbers: {', '.join(ents['numbers'])}" if ents.get("numbers") else "numbers: (none)",
-        "",
-        "LINKS",
-        *(link_lines or ["(none)"]),
-        "",
-        "NAV",
-        *(nav_lines or ["(none)"]),
-        "",
-        "SNIPPETS",
-        *(snips or ["(none)"]),
-        "",
-        "CHUNKS",
-        *chunk_index_lines,
-        "",
-        "NEXT",
-        "Request a section via its id (e.g. sec-2) or ask to follow a specific link (e.g. L7).",
+    sections = [
+        (meta, None),
+        (["OUTLINE", *outline_lines[:80], *_more_line(url, "toc", 80, len(outline_lines)), ""], 2),
+        (["KEYPOINTS", *(kp or ["(none extracted)"]), ""], 3),
+        ([
+            "ENTITIES",
+            f"names: {', '.join(ents['names'])}" if ents.get("names") else "names: (none)",
+            f"years: {', '.join(ents['years'])}" if ents.get("years") else "years: (none)",
+            f"numbers: {', '.join(ents['numbers'])}" if ents.get("numbers") else "numbers: (none)",
+            "",
+        ], 4),
+        (["LINKS", *(link_lines or ["(none)"]), *_more_line(url, "links", 120, len(links)), ""], 6),
+        (["NAV", *(nav_lines or ["(none)"]), ""], 7),
+        (["SNIPPETS", *(snips or ["(none)"]), ""], 5),
+        (["CHUNKS", *chunk_index_lines, ""], 1),
+        (["NEXT", "Request a section via its id (e.g. sec-2) or ask to follow a specific link (e.g. L7)."], None),
     ]
-    return "\n".join([p for p in parts if p is not None])
+    return "\n".join([p for p in _fit_sections(sections, max_tokens) if p is not None])
+
+def _inject_meta(text: str, lines: list[str]) -> str:
+    """Insert extra 'key: value' lines right after the first META header (prepend one if missing)."""
+    if not lines:
+        return text
+    insertion = "META\n" + "\n".join(lines) + "\n"
+    if "META\n" in text:
+        return text.replace("META\n", insertion, 1)
+    return insertion + text
+
+# ------------------------------------------------------------------
+# Speculative link prefetch (opt-in)
+# ------------------------------------------------------------------
+
+_PREFETCH_LINKS = int(os.getenv("WEBTOOL_PREFETCH_LINKS", "0"))  # links warmed after each outline by default (0 = off)
+_PREFETCH_MAX = int(os.getenv("WEBTOOL_PREFETCH_MAX", "10"))  # cap for the per-call `prefetch` argument
+_PREFETCH_WORKERS = int(os.getenv("WEBTOOL_PREFETCH_WORKERS", "2"))
+_prefetch_executor = ThreadPoolExecutor(max_workers=max(1, _PREFETCH_WORKERS), thread_name_prefix="webtool-prefetch")
+_prefetch_lock = threading.Lock()
+_prefetch_inflight: set[str] = set()
+_prefetched: OrderedDict[str, float] = OrderedDict()  # url -> completion time, for prefetch_hit reporting
+_prefetch_stats = {"queued": 0, "fetched": 0, "failed": 0, "used": 0}
+
+
+def _prefetch_count(arguments) -> int:
+    """Links to prefetch for this call: the `prefetch` argument, else WEBTOOL_PREFETCH_LINKS (capped)."""
+    value = (arguments or {}).get("prefetch", _PREFETCH_LINKS) if isinstance(arguments, dict) else _PREFETCH_LINKS
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = 0
+    return max(0, min(count, _PREFETCH_MAX))
+
+
+def _schedule_link_prefetch(html: str | None, url: str, count: int) -> list[str]:
+    """Queue background fetch + parse of the page's first `count` links; returns the queued ids (L#).
+
+    Prefetches use the normal HTML / page caches and per-host limits, so a later
+    link_id follow is served from cache. Links already being prefetched, non-HTTP
+    links and links back to the page itself are skipped.
+    """
+    if count <= 0 or not html:
+        return []
+    page, _, _ = _page_model(html, url)
+    base = urldefrag(url.strip())[0]
+    queued = []
+    for idx, link in enumerate(page["links"][:count], start=1):
+        target = link["url"]
+        if urlparse(target).scheme not in ("http", "https") or urldefrag(target)[0] == base:
+            continue
+        with _prefetch_lock:
+            if target in _prefetch_inflight:
+                continue
+            _prefetch_inflight.add(target)
+            _prefetch_stats["queued"] += 1
+        _prefetch_executor.submit(_prefetch_link, target)
+        queued.append(f"L{idx}")
+    return queued
+
+
+def _prefetch_link(url: str):
+    ok = False
+    try:
+        html, _, error = _cached_fetch_html(url)
+        if html and not error:
+            _page_model(html, url)
+            ok = True
+    except Exception:
+        app.logger.exception(f"prefetch of {url} failed")
+    finally:
+        with _prefetch_lock:
+            _prefetch_inflight.discard(url)
+            if ok:
+                _prefetch_stats["fetched"] += 1
+                _prefetched[url] = time.time()
+                _prefetched.move_to_end(url)
+                while len(_prefetched) > 1024:
+                    _prefetched.popitem(last=False)
+            else:
+                _prefetch_stats["failed"] += 1
+
+
+def _prefetch_used(url: str) -> bool:
+    """True (once) when `url` was warmed by a prefetch."""
+    with _prefetch_lock:
+        if _prefetched.pop(url, None) is None:
+            return False
+        _prefetch_stats["used"] += 1
+        return True
 
 # ------------------------------------------------------------------
 # MCP endpoint modifications (tools list & call)
 # ------------------------------------------------------------------
 
-@app.route('/mcp', methods=['POST', 'GET'])
-def mcp_endpoint():
-    # Always provide SSE stream on GET (LM Studio probes this path for SSE fallback)
-    if request.method == 'GET':
-        headers = {
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
-        return Response(_sse_stream(), headers=headers, mimetype='text/event-stream')
+def _tool_call_target(params) -> tuple[str | None, dict]:
+    """(tool name, arguments) of a tools/call request, accepting the aliases clients use."""
+    name = None
+    arguments = {}
+    if isinstance(params, dict):
+        name = (
+            params.get("name")
+            or params.get("toolName")
+            or params.get("function")
+            or params.get("method")
+        )
+        arguments = params.get("arguments") or params.get("args") or {}
+    return name, arguments
+
+
+def _is_jsonrpc(data) -> bool:
+    return isinstance(data, dict) and data.get("jsonrpc") == "2.0" and ("method" in data or "id" in data)
 
-    # Parse JSON payload (don't fail on empty/invalid JSON)
-    app.logger.debug(f"Received MCP payload: {request.data}")
-    data = request.get_json(silent=True) or {}
 
+_BATCH_MAX_SIZE = int(os.getenv("WEBTOOL_BATCH_MAX_SIZE", "50"))  # requests per JSON-RPC batch
+_BATCH_WORKERS = int(os.getenv("WEBTOOL_BATCH_WORKERS", "8"))  # batch entries executed concurrently
+
+
+def _handle_mcp_payload(data, prefetched: dict | None = None) -> dict | list | None:
+    """Response body for a POST /mcp payload; shared by the Flask view and the asyncio server.
+
+    prefetched optionally maps fetch_url urls to _cached_fetch_html results the caller
+    already obtained (the async server downloads them without blocking a thread).
+    Returns None when there is nothing to send back (a batch of notifications only).
+    """
+    if isinstance(data, list):
+        return _handle_batch(data, prefetched)
     # If this looks like a JSON-RPC 2.0 request, handle MCP JSON-RPC methods
-    if isinstance(data, dict) and data.get("jsonrpc") == "2.0" and ("method" in data or "id" in data):
-        _id = data.get("id")
-        method = data.get("method")
-        params = data.get("params") or {}
-
-        # initialize handshake
-        if method == "initialize":
-            result = {
-                "protocolVersion": "2024-11-05",
-                "serverInfo": {"name": "webtool-mcp", "version": "1.0.0"},
-                "capabilities": {"tools": {}},
-            }
-            return jsonify(_jsonrpc_result(_id, result))
-
-        # list tools
-        if method in ("tools/list", "tools.list"):
-            tools = [
-                {
-                    "name": "fetch_url",
-                    "description": "Fetch and summarize a webpage with outline, links, navigation, snippets, and chunk index. Optional: fetch a specific chunk, outline-only mode, or follow a link id (L#) from the page.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "url": {"type": "string", "description": "HTTP or HTTPS URL (base page or target if not following)"},
-                            "chunk_id": {"type": "string", "description": "Optional section id to return only that chunk (e.g., sec-3)"},
-                            "section": {"type": "string", "description": "Alias for chunk_id"},
-                            "mode": {"type": "string", "enum": ["outline"], "description": "outline = only META/OUTLINE/LINKS/CHUNKS/NEXT"},
-                            "link_id": {"type": "string", "description": "Follow a link from the base page by id (e.g. L7)"}
-                        },
-                        "required": ["url"],
+    if _is_jsonrpc(data):
+        with _progress_scope(token=_progress_token(data)):
+            return _handle_jsonrpc(data, prefetched)
+    return _handle_legacy(data)
+
+
+def _handle_batch(batch: list, prefetched: dict | None = None) -> dict | list | None:
+    """JSON-RPC 2.0 batch: entries run concurrently on a bounded pool.
+
+    Responses keep their ids and input order; notifications (no id) are executed but
+    get no response, and a batch of only notifications returns None. An empty or
+    oversized batch is a single Invalid Request error.
+    """
+    if not batch:
+        return _jsonrpc_error(None, -32600, "Invalid Request", {"hint": "empty batch"})
+    if _BATCH_MAX_SIZE > 0 and len(batch) > _BATCH_MAX_SIZE:
+        return _jsonrpc_error(None, -32600, "Invalid Request", {"hint": f"batch larger than {_BATCH_MAX_SIZE} requests"})
+    sink = getattr(_progress_local, "sink", None)
+    trace = getattr(_trace_local, "trace", None)
+
+    def run(message):
+        if not (isinstance(message, dict) and message.get("jsonrpc") == "2.0" and isinstance(message.get("method"), str)):
+            return _jsonrpc_error(message.get("id") if isinstance(message, dict) else None, -32600, "Invalid Request")
+        try:
+            with _progress_scope(sink=sink, token=_progress_token(message)), _trace_bind(trace):
+                response = _handle_jsonrpc(message, prefetched)
+        except Exception as exc:
+            app.logger.exception("batch entry failed")
+            response = _jsonrpc_error(message.get("id"), -32603, f"Internal error: {exc}")
+        return response if "id" in message else None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(batch), _BATCH_WORKERS)), thread_name_prefix="webtool-batch") as executor:
+        responses = [r for r in executor.map(run, batch) if r is not None]
+    return responses or None
+
+
+_METRIC_TOOLS = frozenset({"fetch_url", "search_wikipedia", "latvian_news", "search_duckduckgo", "web_search", "site_search", "quick_search", "ai_company_news", "get_system_prompt", "search_cache"})
+
+
+def _response_failed(response) -> bool:
+    """True for a JSON-RPC error or a tool result that reports one (isError, 'Error ...' text or an {"error": ...} payload)."""
+    if not isinstance(response, dict) or "error" in response:
+        return True
+    result = response.get("result")
+    if isinstance(result, dict) and result.get("isError"):
+        return True
+    content = result.get("content") if isinstance(result, dict) else None
+    if content and isinstance(content[0], dict):
+        return str(content[0].get("text", "")).lstrip().startswith(("Error", '{"error"'))
+    return False
+
+
+def _handle_jsonrpc(data: dict, prefetched: dict | None = None) -> dict:
+    """Answer one JSON-RPC request; tools/call is counted and timed per tool for /metrics."""
+    if data.get("method") not in ("tools/call", "tools.call"):
+        return _dispatch_jsonrpc(data, prefetched)
+    name, arguments = _tool_call_target(data.get("params") or {})
+    label = name if name in _METRIC_TOOLS else "unknown"
+    attrs = {"url": arguments.get("url")} if isinstance(arguments, dict) and arguments.get("url") else {}
+    with _track_tool(label) as outcome, _span("tool", tool=label, **attrs), _tool_phases():
+        response = _dispatch_jsonrpc(data, prefetched)
+        if _response_failed(response):
+            outcome[0] = "error"
+    return response
+
+
+def _wants_timings(arguments) -> bool:
+    return _TRACE_META or bool(isinstance(arguments, dict) and arguments.get("timings"))
+
+
+def _dispatch_jsonrpc(data: dict, prefetched: dict | None = None) -> dict:
+    _id = data.get("id")
+    method = data.get("method")
+    params = data.get("params") or {}
+
+    # initialize handshake
+    if method == "initialize":
+        result = {
+            "protocolVersion": "2024-11-05",
+            "serverInfo": {"name": "webtool-mcp", "version": "1.0.0"},
+            "capabilities": {"tools": {}},
+        }
+        return _jsonrpc_result(_id, result)
+
+    # list tools
+    if method in ("tools/list", "tools.list"):
+        tools = [
+            {
+                "name": "fetch_url",
+                "description": "Fetch and summarize a webpage with outline, links, navigation, snippets, and chunk index. Optional: fetch a specific chunk, outline-only mode, or follow a link id (L#) from the page.",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "url": {"type": "string", "description": "HTTP or HTTPS URL (base page or target if not following)"},
+                        "chunk_id": {"type": "string", "description": "Optional section id to return only that chunk (e.g., sec-3)"},
+                        "section": {"type": "string", "description": "Alias for chunk_id"},
+                        "mode": {"type": "string", "enum": ["outline", "links", "toc"], "description": "outline = only META/OUTLINE/LINKS/CHUNKS/NEXT; links / toc = one page of the full LINKS / OUTLINE list"},
+                        "link_id": {"type": "string", "description": "Follow a link from the base page by id (e.g. L7)"},
+                        "prefetch": {"type": "number", "description": f"Outline mode: warm the first N links (L1..LN) in the background so a following link_id is served from cache (max {_PREFETCH_MAX})"},
+                        "timings": {"type": "boolean", "description": "Diagnostics: add a timings: line (upstream, download, parse, extract, render ms) to META"},
+                        "query": {"type": "string", "description": "Rank every section against these words (BM25) and return the top_k best inline with their scores, instead of the overview"},
+                        "top_k": {"type": "number", "description": f"Sections returned inline for query (default {_QUERY_TOP_K}, max {_QUERY_TOP_K_MAX})"},
+                        "offset": {"type": "number", "description": "Start of the page: character offset into chunk_id's text, or item offset in mode links / toc"},
+                        "cursor": {"type": "string", "description": "next_cursor from a previous fetch_url call on the same url; continues that section / list (overrides chunk_id, mode and offset)"},
+                        "max_tokens": {"type": "number", "description": f"Output budget in estimated tokens (min {_MIN_MAX_TOKENS}; 0 = unlimited). Small sections are merged, large ones split into sec-N.1, sec-N.2, ..., and lower-value sections (NAV, LINKS, SNIPPETS, ...) are trimmed first"}
                     },
+                    "required": ["url"],
                 },
-                {
-                    "name": "search_wikipedia",
-                    "description": "Get a short summary from Wikipedia",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {"query": {"type": "string", "description": "Search query"}},
-                        "required": ["query"],
-                    },
+            },
+            {
+                "name": "search_wikipedia",
+                "description": "Get a short summary from Wikipedia",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {"query": {"type": "string", "description": "Search query"}},
+                    "required": ["query"],
                 },
-                {
-                    "name": "latvian_news",
-                    "description": "Latest Latvian news headlines or topic search (optional query).",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {"query": {"type": "string", "description": "Optional topic term"}},
-                    },
+            },
+            {
+                "name": "latvian_news",
+                "description": "Latest Latvian news headlines or topic search (optional query).",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {"query": {"type": "string", "description": "Optional topic term"}},
                 },
-                {
-                    "name": "search_duckduckgo",
-                    "description": "DuckDuckGo Instant Answer: abstract + related links for a query.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {"query": {"type": "string", "description": "Search phrase"}},
-                        "required": ["query"],
-                    },
+            },
+            {
+                "name": "search_duckduckgo",
+                "description": "DuckDuckGo Instant Answer: abstract + related links for a query.",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {"query": {"type": "string", "description": "Search phrase"}},
+                    "required": ["query"],
                 },
-                {
-                    "name": "web_search",
-                    "description": "Multi-engine web search (duckduckgo, bing, google_cse, multi). Returns structured result list.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "query": {"type": "string"},
-                            "engine": {"type": "string", "enum": ["duckduckgo", "bing", "google_cse", "multi"], "description": "Search engine (default duckduckgo)"},
-                            "max_results": {"type": "number", "description": "Max results per engine (default 5)"},
-                            "engines": {"type": "array", "items": {"type": "string"}, "description": "When engine=multi specify engines subset"}
-                        }
-                    },
+            },
+            {
+                "name": "web_search",
+                "description": "Multi-engine web search (duckduckgo, bing, google_cse, multi). Returns structured result list.",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string"},
+                        "engine": {"type": "string", "enum": ["duckduckgo", "bing", "google_cse", "multi"], "description": "Search engine (default duckduckgo)"},
+                        "max_results": {"type": "number", "description": "Max results per engine (default 5)"},
+                        "engines": {"type": "array", "items": {"type": "string"}, "description": "When engine=multi specify engines subset"}
+                    }
                 },
-                {
-                    "name": "site_search",
-                    "description": "Convenience wrapper: site-specific search (builds site:domain query then calls web_search).",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "site": {"type": "string", "description": "Domain like example.com (no protocol)"},
-                            "term": {"type": "string", "description": "Search term / phrase"},
-                            "engine": {"type": "string", "enum": ["duckduckgo", "bing", "google_cse", "multi"], "description": "Search engine (default duckduckgo)"},
-                            "max_results": {"type": "number", "description": "Max results (default 5)"},
-                            "engines": {"type": "array", "items": {"type": "string"}, "description": "When engine=multi specify engines subset"}
-                        },
-                        "required": ["site", "term"]
+            },
+            {
+                "name": "site_search",
+                "description": "Convenience wrapper: site-specific search (builds site:domain query then calls web_search).",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "site": {"type": "string", "description": "Domain like example.com (no protocol)"},
+                        "term": {"type": "string", "description": "Search term / phrase"},
+                        "engine": {"type": "string", "enum": ["duckduckgo", "bing", "google_cse", "multi"], "description": "Search engine (default duckduckgo)"},
+                        "max_results": {"type": "number", "description": "Max results (default 5)"},
+                        "engines": {"type": "array", "items": {"type": "string"}, "description": "When engine=multi specify engines subset"}
                     },
+                    "required": ["site", "term"]
                 },
-                {
-                    "name": "quick_search",
-                    "description": "Fast small-result search (duckduckgo→bing fallback) max 3 results for scoping.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {"query": {"type": "string", "description": "Search phrase"}},
-                        "required": ["query"],
-                    },
+            },
+            {
+                "name": "quick_search",
+                "description": "Fast small-result search (duckduckgo→bing fallback) max 3 results for scoping.",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {"query": {"type": "string", "description": "Search phrase"}},
+                    "required": ["query"],
                 },
-                {
-                    "name": "ai_company_news",
-                    "description": "Recent news headlines per AI/tech company (OpenAI, Google, Anthropic, Microsoft, Nvidia by default).",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "companies": {"type": "string", "description": "Optional comma/space separated company names"},
-                            "limit": {"type": "number", "description": "Headlines per company (default 5)"}
-                        }
-                    },
+            },
+            {
+                "name": "ai_company_news",
+                "description": "Recent news headlines per AI/tech company (OpenAI, Google, Anthropic, Microsoft, Nvidia by default).",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "companies": {"type": "string", "description": "Optional comma/space separated company names"},
+                        "limit": {"type": "number", "description": "Headlines per company (default 5)"}
+                    }
                 },
-                {
-                    "name": "get_system_prompt",
-                    "description": "Return the internal system prompt / guidance for tool usage.",
-                    "inputSchema": {"type": "object", "properties": {}},
+            },
+            {
+                "name": "search_cache",
+                "description": "Offline BM25 search over the sections of every page fetched so far. Returns (url, chunk_id, snippet) hits; open one with fetch_url(url, chunk_id).",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Words to look for (any may match; more matches rank higher)"},
+                        "max_results": {"type": "number", "description": f"Max hits (default 10, max {_INDEX_MAX_RESULTS})"},
+                        "site": {"type": "string", "description": "Optional domain to restrict hits to (e.g. docs.python.org)"}
+                    },
+                    "required": ["query"],
                 },
-            ]
-            return jsonify(_jsonrpc_result(_id, {"tools": tools}))
-
-        # call tool
-        if method in ("tools/call", "tools.call"):
-            name = None
-            arguments = {}
-            if isinstance(params, dict):
-                name = (
-                    params.get("name")
-                    or params.get("toolName")
-                    or params.get("function")
-                    or params.get("method")
-                )
-                arguments = params.get("arguments") or params.get("args") or {}
-
-            if name == "fetch_url":
-                url = (arguments or {}).get("url", "")
-                chunk_id = (arguments or {}).get("chunk_id") or (arguments or {}).get("section")
-                mode = (arguments or {}).get("mode")
-                link_id = (arguments or {}).get("link_id")
-                cache_status = []
-                # Use caches
-                html, html_cache_hit, html_error = _cached_fetch_html(url)
-                if html_error:
-                    return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": f"Error fetching URL: {html_error}"}]}))
-                if html_cache_hit:
-                    cache_status.append("html_hit")
-                # Outline cache applies only when outline mode and no chunk/link follow
-                if mode == 'outline' and not chunk_id and not link_id:
-                    cached_outline = _get_cached_outline(url)
-                    if cached_outline is not None:
-                        cache_status.append("outline_hit")
-                        text = cached_outline
-                        # annotate (reuse injection logic later)
-                        marker = "META\n"
-                        insertion = f"META\ncache_status: {','.join(cache_status)}\n"
-                        if marker in text:
-                            text2 = text.replace(marker, insertion, 1)
-                            text = text2
+            },
+            {
+                "name": "get_system_prompt",
+                "description": "Return the internal system prompt / guidance for tool usage.",
+                "inputSchema": {"type": "object", "properties": {}},
+            },
+        ]
+        return _jsonrpc_result(_id, {"tools": tools})
+
+    # call tool
+    if method in ("tools/call", "tools.call"):
+        name, arguments = _tool_call_target(params)
+
+        if name == "fetch_url":
+            url = (arguments or {}).get("url", "")
+            try:
+                chunk_id, mode, offset = _paging_args(arguments, url)
+            except ValueError as e:
+                return _jsonrpc_result(_id, {"content": [{"type": "text", "text": f"Error: {e}"}], "isError": True})
+            link_id = (arguments or {}).get("link_id")
+            query = str((arguments or {}).get("query") or "").strip()
+            top_k = _top_k(arguments)
+            max_tokens = _max_tokens(arguments)
+            render_budget = max_tokens - _BUDGET_META_RESERVE if max_tokens else 0
+            cache_status = []
+            meta_notes = []
+            # Use caches
+            html, html_info, html_error = (prefetched or {}).get(url) or _cached_fetch_html(url)
+            if html_error:
+                return _jsonrpc_result(_id, {"content": [{"type": "text", "text": f"Error fetching URL: {html_error}"}], "isError": True})
+            _report_progress(1, 3 if link_id and not chunk_id else 2, f"fetched {url}")
+            if html_info.get("cache") == "hit":
+                cache_status.append("html_hit")
+            elif html_info.get("cache") == "revalidated":
+                cache_status.append("html_revalidated")
+            elif html_info.get("cache") == "stale":
+                cache_status.append("stale")
+            if html_info.get("coalesced"):
+                cache_status.append("coalesced")
+            if html_info.get("truncated"):
+                meta_notes.append(f"truncated: true (page larger than {_FETCH_MAX_BYTES} bytes; only the beginning was parsed)")
+            # Outline cache applies only when outline mode and no chunk/link follow/query
+            if mode == 'outline' and not chunk_id and not link_id and not query:
+                cached_outline, outline_stale = _get_cached_outline(url, html, render_budget)
+                if cached_outline is not None:
+                    cache_status.append("outline_hit")
+                    if outline_stale and "stale" not in cache_status:
+                        cache_status.append("stale")
+                    prefetch_ids = _schedule_link_prefetch(html, url, _prefetch_count(arguments))
+                    if prefetch_ids:
+                        meta_notes.append(f"prefetching: {', '.join(prefetch_ids)}")
+                    if _wants_timings(arguments):
+                        meta_notes.append(_timings_line())
+                    text = _inject_meta(cached_outline, [f"cache_status: {','.join(cache_status)}", *meta_notes])
+                    return _jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]})
+            failed = False  # error results go back as plain text with isError, without META
+            if html is None:
+                text = "Error: no HTML returned."  # should have been handled above
+                failed = True
+            else:
+                # If link_id provided, perform single-hop follow
+                if link_id and not chunk_id:
+                    try:
+                        base_page, page_hit, page_coalesced = _page_model(html, url)
+                        if page_hit:
+                            cache_status.append("page_hit")
+                        elif page_coalesced:
+                            cache_status.append("page_coalesced")
+                        base_links = base_page["links"]
+                        # normalize link_id like 'L7' or '7'
+                        m = re.match(r'[Ll]?(\d+)', str(link_id).strip())
+                        target_structured = None
+                        if not m:
+                            raise ValueError(f"Invalid link_id format: {link_id}")
+                        idx = int(m.group(1))
+                        if idx < 1 or idx > len(base_links):
+                            raise IndexError(f"link_id {link_id} out of range (1..{len(base_links)})")
+                        chosen = base_links[idx-1]
+                        target_url = chosen['url']
+                        # fetch target
+                        _report_progress(2, 3, f"following {link_id} -> {target_url}")
+                        target_html, target_info, target_error = _cached_fetch_html(target_url)
+                        if target_error:
+                            text = f"Error following {link_id} → {target_url}: {target_error}"
+                            failed = True
                         else:
-                            text = insertion + text
-                        return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]}))
-                if html is None:
-                    text = "Error: no HTML returned."  # should have been handled above
+                            if target_info.get("cache") in ("hit", "revalidated") and _prefetch_used(target_url):
+                                cache_status.append("prefetch_hit")
+                            elif target_info.get("cache") == "hit":
+                                cache_status.append("target_html_hit")
+                            elif target_info.get("cache") == "revalidated":
+                                cache_status.append("target_html_revalidated")
+                            elif target_info.get("cache") == "stale":
+                                cache_status.append("target_stale")
+                            if target_info.get("coalesced"):
+                                cache_status.append("target_coalesced")
+                            if target_info.get("truncated"):
+                                meta_notes.append(f"truncated: true (followed page larger than {_FETCH_MAX_BYTES} bytes; only the beginning was parsed)")
+                            try:
+                                if target_html:
+                                    target_page, target_page_hit, target_page_coalesced = _page_model(target_html, target_url)
+                                    if target_page_hit:
+                                        cache_status.append("target_page_hit")
+                                    elif target_page_coalesced:
+                                        cache_status.append("target_page_coalesced")
+                                    with _span("render"):
+                                        target_structured = _render_page(target_page, mode=mode, max_tokens=render_budget, query=query, top_k=top_k)
+                                else:
+                                    target_structured = format_structured_page(target_html or "", target_url, mode=mode, max_tokens=render_budget, query=query, top_k=top_k)
+                            except Exception as e:
+                                app.logger.exception("format_structured_page (follow) failed")
+                                trunc2 = target_html[:1000].replace('\n',' ')
+                                target_structured = f"Parser error on followed page: {e}\nSource: {target_url}\nSnippet: {trunc2}"
+                                failed = True
+                            text = (
+                                "HISTORY\n"
+                                f"from_page: {url}\n"
+                                f"followed: {link_id} -> {target_url}\n"
+                                f"link_text: {chosen['text']}\n"
+                                "\n" + target_structured
+                            )
+                    except Exception as e:
+                        app.logger.exception("link follow failed")
+                        trunc = html[:800].replace('\n',' ')
+                        text = f"Link follow error: {e}\nBase page snippet: {trunc}\nYou can retry with a different link_id or fetch without link_id."
+                        failed = True
                 else:
-                    # If link_id provided, perform single-hop follow
-                    if link_id and not chunk_id:
-                        try:
-                            base_soup = BeautifulSoup(html, 'html.parser')
-                            main = _select_main(base_soup)
-                            base_links = _gather_links(main, url)
-                            # normalize link_id like 'L7' or '7'
-                            m = re.match(r'[Ll]?(\d+)', str(link_id).strip())
-                            target_structured = None
-                            if not m:
-                                raise ValueError(f"Invalid link_id format: {link_id}")
-                            idx = int(m.group(1))
-                            if idx < 1 or idx > len(base_links):
-                                raise IndexError(f"link_id {link_id} out of range (1..{len(base_links)})")
-                            chosen = base_links[idx-1]
-                            target_url = chosen['url']
-                            # fetch target
-                            target_res = fetch_url(target_url)
-                            if isinstance(target_res, dict) and target_res.get('error'):
-                                text = f"Error following {link_id} → {target_url}: {target_res['error']}"
-                            else:
-                                target_html = target_res.get('content', '')
-                                try:
-                                    target_structured = format_structured_page(target_html, target_url, mode=mode)
-                                except Exception as e:
-                                    app.logger.exception("format_structured_page (follow) failed")
-                                    trunc2 = target_html[:1000].replace('\n',' ')
-                                    target_structured = f"Parser error on followed page: {e}\nSource: {target_url}\nSnippet: {trunc2}"
-                                text = (
-                                    "HISTORY\n"
-                                    f"from_page: {url}\n"
-                                    f"followed: {link_id} -> {target_url}\n"
-                                    f"link_text: {chosen['text']}\n"
-                                    "\n" + target_structured
-                                )
-                        except Exception as e:
-                            app.logger.exception("link follow failed")
-                            trunc = html[:800].replace('\n',' ')
-                            text = f"Link follow error: {e}\nBase page snippet: {trunc}\nYou can retry with a different link_id or fetch without link_id."
-                    else:
-                        try:
-                            text = format_structured_page(html, url, chunk_id=chunk_id, mode=mode)
-                            # Always attempt to store if outline mode (no chunk/link)
-                            if mode == 'outline' and not chunk_id and not link_id:
-                                _store_cached_outline(url, text)
-                        except Exception as e:
-                            app.logger.exception("format_structured_page failed")
-                            trunc = html[:1200].replace('\n', ' ')
-                            text = f"Parser error, fallback raw snippet. Error: {e}\nSource: {url}\nSnippet: {trunc}"
-                if cache_status:
-                    marker = "META\n"
-                    insertion = f"META\ncache_status: {','.join(cache_status)}\n"
-                    if marker in text:
-                        text2 = text.replace(marker, insertion, 1)
-                        if text2 == text:
-                            # fallback append after first line
-                            lines = text.splitlines()
-                            if lines and lines[0] == 'META':
-                                lines.insert(1, f"cache_status: {','.join(cache_status)}")
-                                text = "\n".join(lines)
-                            else:
-                                text = insertion + text
+                    try:
+                        if html:
+                            page, page_hit, page_coalesced = _page_model(html, url)
+                            if page_hit:
+                                cache_status.append("page_hit")
+                            elif page_coalesced:
+                                cache_status.append("page_coalesced")
+                            with _span("render"):
+                                text = _render_page(page, chunk_id=chunk_id, mode=mode, max_tokens=render_budget, offset=offset, query=query, top_k=top_k)
                         else:
-                            text = text2
-                    else:
-                        text = insertion + text
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]}))
-            if name == "search_wikipedia":
-                query = (arguments or {}).get("query", "")
-                res = search_wikipedia(query)
-                # Keep JSON-encoded result as text, it's small
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "latvian_news":
-                q = (arguments or {}).get("query")
-                res = latvian_news(q)
-                items = res.get("items") if isinstance(res, dict) else None
-                if items:
-                    lines = [f"Latvian News{' — ' + q if q else ''}:"]
-                    for it in items:
-                        title = it.get("title", "").strip()
-                        url2 = it.get("url", "").strip()
-                        pub = it.get("published", "").strip()
-                        line = f"• {title} — {url2}"
-                        if pub:
-                            line += f" (Published: {pub})"
-                        lines.append(line)
-                    text = "\n".join(lines)
-                else:
-                    text = json.dumps(res, ensure_ascii=False)
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]}))
-            if name == "search_duckduckgo":
-                query = (arguments or {}).get("query", "")
-                res = search_duckduckgo(query)
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "web_search":
-                # Fallback inference: accept 'q' or first stray string value if 'query' missing
-                query = (arguments or {}).get("query") or (arguments or {}).get("q") or ""
-                if not query and isinstance(arguments, dict):
-                    for k, v in arguments.items():
-                        if k not in {"engine", "max_results", "engines"} and isinstance(v, str) and v.strip():
-                            query = v.strip()
-                            break
-                engine = (arguments or {}).get("engine", "duckduckgo")
-                max_results = (arguments or {}).get("max_results", 5)
-                engines = (arguments or {}).get("engines")
+                            text = format_structured_page(html, url, chunk_id=chunk_id, mode=mode, max_tokens=render_budget, offset=offset, query=query, top_k=top_k)
+                        # Store outline-mode renders (no chunk/link/query) of non-empty pages
+                        if mode == 'outline' and not chunk_id and not link_id and not query and html:
+                            _store_cached_outline(url, text, render_budget)
+                            prefetch_ids = _schedule_link_prefetch(html, url, _prefetch_count(arguments))
+                            if prefetch_ids:
+                                meta_notes.append(f"prefetching: {', '.join(prefetch_ids)}")
+                    except Exception as e:
+                        app.logger.exception("format_structured_page failed")
+                        trunc = html[:1200].replace('\n', ' ')
+                        text = f"Parser error, fallback raw snippet. Error: {e}\nSource: {url}\nSnippet: {trunc}"
+                        failed = True
+            if failed:
+                return _jsonrpc_result(_id, {"content": [{"type": "text", "text": text}], "isError": True})
+            if cache_status:
+                meta_notes.insert(0, f"cache_status: {','.join(cache_status)}")
+            if _wants_timings(arguments):
+                meta_notes.append(_timings_line())
+            text = _inject_meta(text, meta_notes)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]})
+        if name == "search_wikipedia":
+            query = (arguments or {}).get("query", "")
+            res = search_wikipedia(query)
+            # Keep JSON-encoded result as text, it's small
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "latvian_news":
+            q = (arguments or {}).get("query")
+            res = latvian_news(q)
+            items = res.get("items") if isinstance(res, dict) else None
+            if items:
+                lines = [f"Latvian News{' — ' + q if q else ''}:"]
+                for it in items:
+                    title = it.get("title", "").strip()
+                    url2 = it.get("url", "").strip()
+                    pub = it.get("published", "").strip()
+                    line = f"• {title} — {url2}"
+                    if pub:
+                        line += f" (Published: {pub})"
+                    lines.append(line)
+                text = "\n".join(lines)
+            else:
+                text = json.dumps(res, ensure_ascii=False)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": text}]})
+        if name == "search_duckduckgo":
+            query = (arguments or {}).get("query", "")
+            res = search_duckduckgo(query)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "web_search":
+            # Fallback inference: accept 'q' or first stray string value if 'query' missing
+            query = (arguments or {}).get("query") or (arguments or {}).get("q") or ""
+            if not query and isinstance(arguments, dict):
+                for k, v in arguments.items():
+                    if k not in {"engine", "max_results", "engines"} and isinstance(v, str) and v.strip():
+                        query = v.strip()
+                        break
+            engine = (arguments or {}).get("engine", "duckduckgo")
+            max_results = (arguments or {}).get("max_results", 5)
+            engines = (arguments or {}).get("engines")
+            res = web_search(query, engine=engine, max_results=max_results, engines=engines)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "site_search":
+            site = (arguments or {}).get("site", "").strip()
+            term = (arguments or {}).get("term", "").strip()
+            engine = (arguments or {}).get("engine", "duckduckgo")
+            max_results = (arguments or {}).get("max_results", 5)
+            engines = (arguments or {}).get("engines")
+            if not site or not term:
+                res = {"error": "site and term required"}
+            else:
+                domain = site.replace("http://", "").replace("https://", "").split("/")[0]
+                query = f"site:{domain} {term}".strip()
                 res = web_search(query, engine=engine, max_results=max_results, engines=engines)
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "site_search":
-                site = (arguments or {}).get("site", "").strip()
-                term = (arguments or {}).get("term", "").strip()
-                engine = (arguments or {}).get("engine", "duckduckgo")
-                max_results = (arguments or {}).get("max_results", 5)
-                engines = (arguments or {}).get("engines")
-                if not site or not term:
-                    res = {"error": "site and term required"}
-                else:
-                    domain = site.replace("http://", "").replace("https://", "").split("/")[0]
-                    query = f"site:{domain} {term}".strip()
-                    res = web_search(query, engine=engine, max_results=max_results, engines=engines)
-                    res["site"] = domain
-                    res["original_term"] = term
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "quick_search":
-                query = (arguments or {}).get("query", "")
-                res = quick_search(query)
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "ai_company_news":
-                companies = (arguments or {}).get("companies")
-                limit = (arguments or {}).get("limit", 5)
-                res = ai_company_news(companies, limit=limit)
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]}))
-            if name == "get_system_prompt":
-                prm = get_system_prompt()
-                return jsonify(_jsonrpc_result(_id, {"content": [{"type": "text", "text": prm["prompt"]}]}))
-
-            return jsonify(_jsonrpc_error(_id, -32601, f"Unknown tool '{name}'"))
-
-        # Unknown JSON-RPC method
-        return jsonify(_jsonrpc_error(_id, -32601, f"Unknown method '{method}'"))
-
-    # ------------- Legacy simple payloads for manual testing -------------
+                res["site"] = domain
+                res["original_term"] = term
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "quick_search":
+            query = (arguments or {}).get("query", "")
+            res = quick_search(query)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "ai_company_news":
+            companies = (arguments or {}).get("companies")
+            limit = (arguments or {}).get("limit", 5)
+            res = ai_company_news(companies, limit=limit)
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "search_cache":
+            res = search_cache((arguments or {}).get("query", ""), (arguments or {}).get("max_results", 10), (arguments or {}).get("site"))
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": json.dumps(res, ensure_ascii=False)}]})
+        if name == "get_system_prompt":
+            prm = get_system_prompt()
+            return _jsonrpc_result(_id, {"content": [{"type": "text", "text": prm["prompt"]}]})
+
+        return _jsonrpc_error(_id, -32601, f"Unknown tool '{name}'")
+
+    # Unknown JSON-RPC method
+    return _jsonrpc_error(_id, -32601, f"Unknown method '{method}'")
+
+
+def _handle_legacy(data) -> dict:
+    """Legacy simple payloads for manual testing ('function'/'args' or 'name'/'arguments')."""
     # Determine function name and arguments from either 'function'/'args' or 'name'/'arguments'
     function_name = None
     args = {}
@@ -1137,7 +3732,7 @@ def mcp_endpoint():
         # For POSTs without JSON-RPC and no function specified, return a JSON-RPC error envelope
         # so MCP clients parsing strict JSON-RPC won't fail.
         hint = "Send JSON-RPC 2.0 or include 'function'/'name'. (If using curl, ensure -d JSON is in the same command; newline breaks will drop the body.)"
-        return jsonify(_jsonrpc_error(None, -32600, "Invalid Request", {"hint": hint}))
+        return _jsonrpc_error(None, -32600, "Invalid Request", {"hint": hint})
 
     # Handle generic info/handshake-like names gracefully
     if function_name in ('initialize', 'list_tools', 'health', 'info'):
@@ -1147,7 +3742,7 @@ def mcp_endpoint():
             result["system_prompt_head"] = get_system_prompt()["prompt"].splitlines()[:6]
         except Exception:
             result["system_prompt_head"] = ["(failed to load system prompt)"]
-        return jsonify({"response": result})
+        return {"response": result}
 
     # Dispatch to helper functions
     if function_name == 'fetch_url':
@@ -1170,15 +3765,387 @@ def mcp_endpoint():
     else:
         # Instead of hard error, respond with info so clients don't fail to connect
         app.logger.error(f"Unknown function '{function_name}'")
-        return jsonify({"response": available_functions_info(), "warning": f"Unknown function '{function_name}'"})
+        return {"response": available_functions_info(), "warning": f"Unknown function '{function_name}'"}
 
     # Return format expected by LM Studio's legacy manual testing: {"response": ...}
-    return jsonify({"response": result})
+    return {"response": result}
 
-if __name__ == "__main__":
-    # Simple health check endpoint for quick diagnostics
-    @app.route('/health', methods=['GET'])
-    def health():
-        return jsonify({"status": "ok"})
 
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+@app.route('/mcp', methods=['POST', 'GET'])
+def mcp_endpoint():
+    # Always provide SSE stream on GET (LM Studio probes this path for SSE fallback)
+    if request.method == 'GET':
+        session = _sse_hub.open()
+        if session is None:
+            return jsonify(_jsonrpc_error(None, -32000, "Too many SSE sessions; retry later")), 503
+        headers = {
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+        return Response(_sse_stream(session), headers=headers, mimetype='text/event-stream')
+
+    # Parse JSON payload (don't fail on empty/invalid JSON)
+    app.logger.debug(f"Received MCP payload: {request.data}")
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    # Messages for an SSE session are answered on its stream
+    session_id = request.args.get("session_id")
+    if session_id:
+        session = _sse_hub.get(session_id)
+        if session is None:
+            return jsonify(_jsonrpc_error(data.get("id") if isinstance(data, dict) else None, -32001, "Unknown or closed SSE session; reconnect with GET /mcp")), 404
+        _sse_executor.submit(_sse_hub.deliver, session, data)
+        return Response(status=202)
+    with _trace_request("http"):
+        body = _handle_mcp_payload(data)
+        if body is None:
+            return Response(status=204)
+        with _span("serialize"):
+            return jsonify(body)
+
+
+def _health_payload() -> dict:
+    with _trace_lock:
+        tracing = {"file": _TRACE_FILE or None, "sample": _TRACE_SAMPLE, **_trace_stats}
+    backend, report = _parser_selection()
+    return {"status": "ok", "http_pool": _http.stats(), "caches": _cache_stats(), "prefetch": dict(_prefetch_stats), "sse": _sse_hub.stats(), "parser": {"backend": backend, "selftest": report}, "tracing": tracing}
+
+
+def _render_metrics() -> str:
+    """/metrics body: stored counters and histograms plus gauges read from the cache, pool and SSE stats."""
+    caches = _cache_stats()
+    extra = []
+    cache_fields = (("hits", "counter", "Cache lookups that were served"), ("misses", "counter", "Cache lookups that missed"),
+                    ("evictions", "counter", "Entries evicted to stay within the byte / entry budget"),
+                    ("expirations", "counter", "Entries dropped on read because their TTL passed"),
+                    ("entries", "gauge", "Entries held in memory"), ("bytes", "gauge", "Bytes held in memory"),
+                    ("hit_ratio", "gauge", "hits / (hits + misses) since start"))
+    names = ("html", "outline", "page", "search")
+    for field, kind, help_text in cache_fields:
+        suffix = "_total" if kind == "counter" else ""
+        extra.append((f"webtool_cache_{field}{suffix}", kind, f"{help_text}, per cache.", [({"cache": n}, caches[n][field]) for n in names]))
+    extra.append(("webtool_cache_coalesced_total", "counter", "Callers that waited on an identical in-flight fetch or parse instead of repeating it.",
+                  [({"cache": n}, caches[n]["single_flight"]["coalesced"]) for n in ("html", "page")]))
+    revalidations = caches["html"]["revalidations"]
+    extra.append(("webtool_cache_revalidations_total", "counter", "Conditional GETs for expired HTML by outcome.",
+                  [({"outcome": k}, v) for k, v in sorted(revalidations.items())]))
+    extra.append(("webtool_cache_stale_refreshes_total", "counter", "Background refreshes scheduled after serving a stale HTML / outline entry.",
+                  [({}, caches["stale_refresh"]["scheduled"])]))
+    active, idle = [], []
+    for host, st in _http.stats().items():
+        label = _metrics.host_label(host)
+        if "active" in st:
+            active.append(({"host": label}, st["active"]))
+        if "idle_connections" in st:
+            idle.append(({"host": label}, st["idle_connections"]))
+    extra.append(("webtool_upstream_in_flight", "gauge", "Upstream requests holding a per-host concurrency slot.", active))
+    extra.append(("webtool_http_pool_idle_connections", "gauge", "Idle keep-alive connections per host.", idle))
+    extra.append(("webtool_sse_sessions", "gauge", "Open SSE sessions.", [({}, _sse_hub.stats()["sessions"])]))
+    extra.append(("webtool_prefetch_total", "counter", "Link prefetches by outcome.", [({"outcome": k}, v) for k, v in sorted(_prefetch_stats.items())]))
+    return _metrics.render(extra)
+
+
+# Registered at import time so WSGI servers (gunicorn app:app) expose them too.
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify(_health_payload())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(_render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    payload, status = _admin_profile(request.method, request.headers.get("Authorization", ""), request.args)
+    return jsonify(payload), status
+
+# ------------------------------------------------------------------
+# asyncio serving mode (optional: `python app.py --async`, needs aiohttp)
+# ------------------------------------------------------------------
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:  # only required for the async server
+    aiohttp = None
+    web = None
+
+_SERVER_MODE = os.getenv("WEBTOOL_SERVER_MODE", "threaded").strip().lower()  # threaded | async
+_ASYNC_WORKERS = int(os.getenv("WEBTOOL_ASYNC_WORKERS", "16"))  # threads for parsing/rendering and tools without an async path
+_ASYNC_MAX_CONNECTIONS = int(os.getenv("WEBTOOL_ASYNC_MAX_CONNECTIONS", "512"))  # concurrent upstream sockets
+
+
+async def _async_acquire(host: str):
+    waited = 0.0
+    while True:
+        wait = _http.throttle_step(host, waited)
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+@asynccontextmanager
+async def _async_get(session, url: str, headers: dict | None = None, timeout: float = 10):
+    """Non-blocking counterpart of _HttpClient.get: same retry policy, per-host limits and counters.
+
+    Yields the response; the host's concurrency slot is held until the block exits.
+    """
+    host = (urlparse(url).hostname or "").lower()
+    client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+    attempt = 0
+    while True:
+        await _async_acquire(host)
+        _http.count(host, "requests")
+        start = time.perf_counter()
+        try:
+            resp = await session.get(url, headers=headers, timeout=client_timeout)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            _observe_upstream(host, start, None)
+            _http.release(host)
+            if attempt >= _http.retries:
+                _http.count(host, "errors")
+                raise
+            _http.count(host, "retries")
+            await asyncio.sleep(_http.backoff_delay(attempt))
+            attempt += 1
+            continue
+        except BaseException:
+            _http.release(host)
+            raise
+        _observe_upstream(host, start, resp.status)
+        if resp.status in _HTTP_RETRY_STATUS and attempt < _http.retries:
+            retry_after = resp.headers.get("Retry-After")
+            resp.release()
+            _http.release(host)
+            _http.count(host, "retries")
+            await asyncio.sleep(_http.backoff_delay(attempt, retry_after))
+            attempt += 1
+            continue
+        if resp.status >= 400:
+            _http.count(host, "errors")
+        break
+    try:
+        async with resp:
+            yield resp
+    finally:
+        _http.release(host)
+
+
+async def _async_read_capped(resp, max_bytes: int) -> tuple[bytes, bool]:
+    buf = bytearray()
+    async for chunk in resp.content.iter_chunked(64 * 1024):
+        if max_bytes > 0 and len(buf) + len(chunk) > max_bytes:
+            buf += chunk[: max_bytes - len(buf)]
+            return bytes(buf), True
+        buf += chunk
+    return bytes(buf), False
+
+
+async def _async_fetch_url(session, url: str, validators: dict | None = None) -> dict:
+    """fetch_url over aiohttp: same result shape, size cap, content-type gate and decoding."""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        async with _async_get(session, url, headers=headers or None) as resp:
+            cache_headers = {h.lower(): resp.headers[h] for h in _CACHE_HEADERS if h in resp.headers}
+            if resp.status == 304:
+                if headers:
+                    return {"not_modified": True, "headers": cache_headers}
+                return {"error": _unsolicited_304(url)}
+            if resp.status >= 400:
+                kind = "Client" if resp.status < 500 else "Server"
+                return {"error": f"Could not fetch {url}: {resp.status} {kind} Error: {resp.reason} for url: {resp.url}"}
+            content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and _FETCH_ALLOWED_TYPES and content_type not in _FETCH_ALLOWED_TYPES:
+                return {"error": f"Unsupported content type '{content_type}' at {url}: fetch_url reads HTML/text pages only."}
+            body, truncated = await _async_read_capped(resp, _FETCH_MAX_BYTES)
+            _metrics.inc("webtool_upstream_bytes_total", len(body), host=_metrics.host_label((urlparse(url).hostname or "").lower()))
+            return {
+                "content": _decode_body(body, resp.headers),
+                "headers": cache_headers,
+                "content_type": content_type,
+                "bytes": len(body),
+                "truncated": truncated,
+            }
+    except ValueError:  # includes aiohttp.InvalidURL
+        return {"error": f"Could not fetch {url}: Invalid URL {url!r}"}
+    except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamThrottled) as exc:
+        return {"error": f"Could not fetch {url}: {exc or type(exc).__name__}"}
+
+
+async def _async_cached_fetch_html(session, executor, url: str) -> tuple[str | None, dict, str | None]:
+    """_cached_fetch_html with the network round-trip awaited instead of holding a thread.
+
+    Cache reads/writes (which may touch the SQLite tier) run on the executor.
+    """
+    loop = asyncio.get_running_loop()
+    entry, ready = await loop.run_in_executor(executor, _html_cache_lookup, url)
+    if ready is not None:
+        return ready
+    key = url.strip()
+    fut, leader = _html_flight.begin(key)  # shared with threaded callers of _cached_fetch_html
+    if not leader:
+        return _coalesced_result(await asyncio.wrap_future(fut))
+    try:
+        res = await _async_fetch_url(session, url, validators=_html_validators(entry))
+        result = await loop.run_in_executor(executor, _html_cache_update, url, entry, res)
+    except BaseException as exc:
+        _html_flight.finish(key, fut, exc=exc)
+        raise
+    _html_flight.finish(key, fut, result)
+    return result
+
+
+def _fetch_url_targets(data) -> list[str]:
+    """URLs of the JSON-RPC fetch_url calls in a payload (single request or batch)."""
+    urls = []
+    for message in data if isinstance(data, list) else [data]:
+        if not _is_jsonrpc(message) or message.get("method") not in ("tools/call", "tools.call"):
+            continue
+        name, arguments = _tool_call_target(message.get("params") or {})
+        if name == "fetch_url" and isinstance(arguments, dict) and arguments.get("url", "") not in urls:
+            urls.append(arguments.get("url", ""))
+    return urls
+
+
+async def _async_prefetch(aio_app, data) -> dict:
+    """Download the pages of every fetch_url call in the payload concurrently."""
+    urls = _fetch_url_targets(data)
+    results = await asyncio.gather(*(_async_cached_fetch_html(aio_app["session"], aio_app["executor"], url) for url in urls))
+    return dict(zip(urls, results))
+
+
+async def _async_mcp_post(request):
+    raw = await request.read()
+    app.logger.debug(f"Received MCP payload: {raw}")
+    data = {}
+    content_type = request.content_type or ""
+    if content_type == "application/json" or (content_type.startswith("application/") and content_type.endswith("+json")):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = {}
+        if data is None:
+            data = {}
+    session_id = request.query.get("session_id")
+    if session_id:
+        session = _sse_hub.get(session_id)
+        if session is None:
+            return web.json_response(_jsonrpc_error(data.get("id") if isinstance(data, dict) else None, -32001, "Unknown or closed SSE session; reconnect with GET /mcp"), status=404)
+        task = asyncio.ensure_future(_async_sse_deliver(request.app, session, data))
+        request.app["sse_tasks"].add(task)
+        task.add_done_callback(request.app["sse_tasks"].discard)
+        return web.Response(status=202)
+    loop = asyncio.get_running_loop()
+    trace = _Trace("async")  # passed explicitly: the event loop thread interleaves requests
+    start = time.perf_counter()
+    prefetched = await _async_prefetch(request.app, data)
+    if prefetched:
+        trace.add("prefetch", start, time.perf_counter() - start, urls=len(prefetched))
+    body = await loop.run_in_executor(request.app["executor"], _run_traced, trace, partial(_handle_mcp_payload, data, prefetched))
+    if body is None:
+        response = web.Response(status=204)
+    else:
+        start = time.perf_counter()
+        response = web.json_response(body)
+        trace.add("serialize", start, time.perf_counter() - start)
+    if _trace_logger is not None:
+        await loop.run_in_executor(request.app["executor"], _export_trace, trace)
+    return response
+
+
+async def _async_sse_deliver(aio_app, session: _SseSession, data):
+    prefetched = await _async_prefetch(aio_app, data)
+    await asyncio.get_running_loop().run_in_executor(aio_app["executor"], _sse_hub.deliver, session, data, prefetched)
+
+
+async def _async_mcp_sse(request):
+    session = _sse_hub.open()
+    if session is None:
+        return web.json_response(_jsonrpc_error(None, -32000, "Too many SSE sessions; retry later"), status=503)
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    session.waker = partial(loop.call_soon_threadsafe, ready.set)
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    })
+    try:
+        await resp.prepare(request)
+        while not session.closed:
+            for frame in session.drain():
+                await resp.write(frame.encode("utf-8"))
+            await ready.wait()
+            ready.clear()
+    except ConnectionResetError:
+        pass  # client went away mid-write; CancelledError (disconnect / shutdown) propagates to aiohttp
+    finally:
+        _sse_hub.close(session.id)
+    return resp
+
+
+async def _async_health(request):
+    return web.json_response(_health_payload())
+
+
+async def _async_admin_profile(request):
+    payload, status = _admin_profile(request.method, request.headers.get("Authorization", ""), request.query)
+    return web.json_response(payload, status=status)
+
+
+async def _async_metrics(request):
+    body = await asyncio.get_running_loop().run_in_executor(request.app["executor"], _render_metrics)
+    return web.Response(body=body.encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def _create_async_app():
+    """aiohttp application serving the same /mcp and /health surface as the Flask app.
+
+    Upstream HTML for fetch_url is downloaded on the event loop, so slow sites cost a
+    socket rather than a thread; parsing, rendering and the remaining tools run on a
+    bounded thread pool (WEBTOOL_ASYNC_WORKERS).
+    """
+    if web is None:
+        raise RuntimeError("The async server needs aiohttp: pip install aiohttp")
+    aio_app = web.Application()
+
+    async def _startup(aio_app):
+        connector = aiohttp.TCPConnector(limit=_ASYNC_MAX_CONNECTIONS)
+        aio_app["session"] = aiohttp.ClientSession(connector=connector, headers={"User-Agent": _HTTP_USER_AGENT})
+        aio_app["executor"] = ThreadPoolExecutor(max_workers=max(1, _ASYNC_WORKERS), thread_name_prefix="webtool-async")
+        aio_app["sse_tasks"] = set()
+
+    async def _cleanup(aio_app):
+        await aio_app["session"].close()
+        aio_app["executor"].shutdown(wait=False, cancel_futures=True)
+
+    aio_app.on_startup.append(_startup)
+    aio_app.on_cleanup.append(_cleanup)
+    aio_app.router.add_post("/mcp", _async_mcp_post)
+    aio_app.router.add_get("/mcp", _async_mcp_sse)
+    aio_app.router.add_get("/health", _async_health)
+    aio_app.router.add_get("/metrics", _async_metrics)
+    aio_app.router.add_get("/admin/profile", _async_admin_profile)
+    aio_app.router.add_post("/admin/profile", _async_admin_profile)
+    return aio_app
+
+if __name__ == "__main__":
+    backend, report = _parser_selection()  # chosen here so the first request does not pay for the self-test
+    print(f"html parser backend: {backend} (self-benchmark: {json.dumps(report)})")
+    if "--async" in sys.argv[1:] or _SERVER_MODE == "async":
+        if web is None:
+            sys.exit("The async server needs aiohttp: pip install aiohttp")
+        web.run_app(_create_async_app(), host="0.0.0.0", port=5000)
+    else:
+        app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""Offline benchmark of the page formatter over the saved corpus in benchmarks/corpus/.
+
+For every page it times format_structured_page in outline, global and chunk mode
+(cold: the parsed-page cache is cleared before each run, so parsing is included)
+and the extraction helpers _build_chunks, _gather_links and _entities on a
+pre-parsed page. It also reports throughput and tracemalloc peak memory. With a
+baseline it fails (exit 1) when an operation's output changed or its peak memory
+grew past the threshold; with --timing also when it got slower than the threshold allows:
+
+    python benchmarks/bench_corpus.py                     # compare with benchmarks/baseline.json
+    python benchmarks/bench_corpus.py --save              # record a new baseline
+    python benchmarks/bench_corpus.py --timing --threshold 0.5 --pages docs,news
+
+Timings are compared relative to a reference operation measured in the same run on
+the same page (a bare BeautifulSoup parse, which webtool code does not affect), so
+machine speed and load mostly cancel out. They are still noisier than digests,
+which is why the timing gate is opt-in.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+os.environ.setdefault("WEBTOOL_DISK_CACHE_DIR", "")
+os.environ.setdefault("WEBTOOL_INDEX_BYTES", "0")
+os.environ.setdefault("WEBTOOL_PARSER_SELFTEST", "0")
+
+import app  # noqa: E402
+
+CORPUS_DIR = os.path.join(HERE, "corpus")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+MIN_DELTA_MS = 0.5  # smaller slowdowns are timer noise, whatever the ratio
+MIN_DELTA_KIB = 64
+
+
+def load_corpus(only: list[str] | None) -> dict[str, str]:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if only and name not in only:
+            continue
+        with open(path, encoding="utf-8") as f:
+            pages[name] = f.read()
+    return pages
+
+
+def operations(name: str, html: str) -> dict:
+    """name -> zero-argument callable returning the operation's output."""
+    url = f"https://bench.example/{name}.html"
+    page = app._parse_page(html, url)
+    chunk_id = page["chunks"][len(page["chunks"]) // 2]["id"]
+    soup = app._make_soup(html)
+    index = app._index_dom(soup)
+    main = app._select_main(soup, index)
+    headings = app._extract_headings(main, index)
+    full_text = " \n".join(c["text"] for c in page["chunks"] if c.get("text"))
+
+    def cold(**kwargs):
+        def run():
+            app._page_cache.clear()
+            return app.format_structured_page(html, url, **kwargs)
+        return run
+
+    return {
+        "format_outline": cold(mode="outline"),
+        "format_global": cold(),
+        "format_chunk": cold(chunk_id=chunk_id),
+        "build_chunks": lambda: app._build_chunks(headings, main, index),
+        "gather_links": lambda: app._gather_links(main, url, index),
+        "entities": lambda: app._entities(full_text),
+    }
+
+
+def digest(output) -> str:
+    """Stable hash of an operation's output (the fetched_at timestamp is ignored)."""
+    if isinstance(output, str):
+        text = "\n".join(line for line in output.splitlines() if not line.startswith("fetched_at:"))
+    else:
+        text = json.dumps(output, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def measure(fn, repeat: int) -> tuple[float, float]:
+    """(best-of-repeat ms, tracemalloc peak KiB) of fn."""
+    fn()  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1024
+
+
+def reference(html: str):
+    """Same-run yardstick for a page: tree construction alone (no webtool code involved)."""
+    return lambda: app._make_soup(html)
+
+
+def run(pages: dict[str, str], repeat: int) -> dict:
+    results = {}
+    for name, html in pages.items():
+        size = len(html.encode("utf-8"))
+        ref_ms, _ = measure(reference(html), repeat)
+        results[name] = {"bytes": size, "ops": {}}
+        for op, fn in operations(name, html).items():
+            ms, peak_kib = measure(fn, repeat)
+            results[name]["ops"][op] = {"ms": round(ms, 3), "peak_kib": round(peak_kib, 1), "digest": digest(fn())}
+        ref_ms = min(ref_ms, measure(reference(html), repeat)[0])  # before and after the ops, so a noisy moment does not skew the scale
+        results[name]["reference_ms"] = round(ref_ms, 3)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, timing: bool) -> list[tuple]:
+    problems = []
+    for name, page in results.items():
+        base_page = baseline["results"].get(name)
+        if base_page is None:
+            continue
+        scale = page["reference_ms"] / base_page["reference_ms"] if base_page.get("reference_ms") else 1.0
+        for op, cur in page["ops"].items():
+            base = base_page["ops"].get(op)
+            if base is None:
+                continue
+            allowed_ms = base["ms"] * scale * (1 + threshold)
+            if timing and cur["ms"] > allowed_ms and cur["ms"] - base["ms"] * scale > MIN_DELTA_MS:
+                problems.append((name, op, "time", f"{cur['ms']:.2f} ms vs {base['ms'] * scale:.2f} ms expected (+{threshold:.0%} allowed)"))
+            if cur["peak_kib"] > base["peak_kib"] * (1 + threshold) and cur["peak_kib"] - base["peak_kib"] > MIN_DELTA_KIB:
+                problems.append((name, op, "memory", f"peak {cur['peak_kib']:.0f} KiB vs {base['peak_kib']:.0f} KiB"))
+            if cur["digest"] != base["digest"]:
+                problems.append((name, op, "output", f"output changed (digest {cur['digest']} != {base['digest']})"))
+    return problems
+
+
+def confirm(results: dict, pages: dict[str, str], problems: list[tuple], repeat: int):
+    """Re-time suspected slowdowns with more runs before reporting them (keeps the faster results)."""
+    for name, op, kind, _ in problems:
+        if kind == "time":
+            ms, _ = measure(operations(name, pages[name])[op], repeat * 3)
+            cur = results[name]["ops"][op]
+            cur["ms"] = round(min(cur["ms"], ms), 3)
+            ref_ms, _ = measure(reference(pages[name]), repeat * 3)
+            results[name]["reference_ms"] = round(min(results[name]["reference_ms"], ref_ms), 3)
+
+
+def print_table(results: dict):
+    print(f"{'page':<12} {'op':<15} {'ms':>9} {'MB/s':>8} {'peak KiB':>10}")
+    for name, page in results.items():
+        for op, cur in page["ops"].items():
+            mb_s = page["bytes"] / 1e6 / (cur["ms"] / 1000) if cur["ms"] else 0.0
+            print(f"{name:<12} {op:<15} {cur['ms']:9.2f} {mb_s:8.2f} {cur['peak_kib']:10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per operation (the fastest is reported)")
+    parser.add_argument("--pages", default="", help="comma-separated corpus page names (default: all)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("WEBTOOL_BENCH_THRESHOLD", "0.25")),
+                        help="allowed slowdown / memory growth as a fraction (default 0.25)")
+    parser.add_argument("--timing", action="store_true", default=os.getenv("WEBTOOL_BENCH_TIMING", "") == "1",
+                        help="also fail on slowdowns (off by default: timings are noisy on shared machines)")
+    parser.add_argument("--json", help="also write the raw results to this file")
+    args = parser.parse_args()
+
+    pages = load_corpus([p.strip() for p in args.pages.split(",") if p.strip()])
+    if not pages:
+        print(f"no corpus pages found in {CORPUS_DIR}")
+        return 2
+    results = run(pages, max(1, args.repeat))
+    print(f"parser={app._parser_backend()} python={platform.python_version()}")
+    print_table(results)
+    report = {"parser": app._parser_backend(), "python": platform.python_version(), "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save to record one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("parser") != app._parser_backend():
+        print(f"baseline was recorded with parser={baseline.get('parser')}; set WEBTOOL_HTML_PARSER to match or record a new one")
+        return 2
+    problems = compare(results, baseline, args.threshold, args.timing)
+    if any(kind == "time" for _, _, kind, _ in problems):
+        confirm(results, pages, problems, max(1, args.repeat))
+        problems = compare(results, baseline, args.threshold, args.timing)
+    for name, op, _, message in problems:
+        print(f"REGRESSION {name}/{op}: {message}")
+    print("ok" if not problems else f"{len(problems)} regression(s) against {os.path.relpath(args.baseline)}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
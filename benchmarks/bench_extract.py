@@ -0,0 +1,170 @@
+"""Micro-benchmark: legacy per-helper traversals vs the single-pass DOM index.
+
+Builds a long, heading-heavy synthetic page (nested h1/h2/h3 sections with nav and
+inline links), checks both extraction paths produce identical output and prints the
+timings. Runs offline:
+
+    python benchmarks/bench_extract.py [--sections 300] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+from urllib.parse import urljoin
+
+from bs4 import NavigableString, Tag
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("WEBTOOL_DISK_CACHE_DIR", "")
+os.environ.setdefault("WEBTOOL_PARSER_SELFTEST", "0")
+
+import app  # noqa: E402
+
+
+def build_page(sections: int) -> str:
+    parts = ["<html><head><title>Bench page</title>",
+             '<meta name="description" content="Synthetic heading-heavy page"></head><body>',
+             "<nav>" + "".join(f'<a href="/nav/{i}">Nav {i}</a>' for i in range(40)) + "</nav><main>"]
+    for s in range(sections):
+        parts.append(f"<h1>Part {s}</h1><p>Intro paragraph {s} with <a href='/p/{s}'>a link</a>.</p>")
+        for sub in range(3):
+            parts.append(f"<h2>Section {s}.{sub}</h2><p>Body text for section {s}.{sub}, "
+                         f"mentioning Example Corp and the year 2024.</p>")
+            for leaf in range(2):
+                parts.append(f"<h3>Detail {s}.{sub}.{leaf}</h3><ul><li>Item one</li><li>Item "
+                             f"<b>two</b> <a href='/d/{s}/{sub}/{leaf}'>ref</a></li></ul>")
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+# Reference implementation: the per-helper traversals app.py used before the DOM index.
+# Each helper walks the tree again; kept here only to check and time the indexed path.
+
+def legacy_select_main(soup):
+    for sel in ["main", "article"]:
+        tag = soup.find(sel)
+        if isinstance(tag, Tag):
+            return tag
+    body = soup.body
+    return body if isinstance(body, Tag) else soup
+
+
+def legacy_extract_headings(main):
+    headings = []
+    for tag in main.find_all(app._HEADING_TAGS):
+        title = app._collapse(tag.get_text(" "))
+        if title:
+            headings.append({"level": int(tag.name[1]), "title": title, "tag": tag})
+    return headings
+
+
+def legacy_build_chunks(headings, main):
+    if not headings:
+        text = app._collapse(main.get_text(" "))
+        return [{"id": "sec-1", "heading": "Document", "level": 1, "text": text, "tokens": app._token_estimate(text)}]
+    chunks = []
+    for idx, h in enumerate(headings):
+        stop_tags = []
+        for nxt in headings[idx + 1:]:
+            if nxt["level"] <= h["level"]:
+                stop_tags.append(nxt["tag"])
+                break
+        texts = []
+        cur = h["tag"].next_sibling
+        while cur and (not stop_tags or cur != stop_tags[0]):
+            if isinstance(cur, Tag):
+                if cur.name in app._HEADING_TAGS:
+                    break
+                txt = app._collapse(cur.get_text(" "))
+                if txt:
+                    texts.append(txt)
+            elif isinstance(cur, NavigableString):
+                txt = app._collapse(str(cur))
+                if txt:
+                    texts.append(txt)
+            cur = cur.next_sibling
+        body_text = " \n".join(texts).strip()
+        chunks.append({"id": f"sec-{idx+1}", "heading": h["title"], "level": h["level"],
+                       "text": body_text, "tokens": app._token_estimate(body_text)})
+    return chunks
+
+
+def _dedupe(items, limit):
+    seen = set()
+    out = []
+    for item in items:
+        key = (item["text"], item["url"])
+        if key not in seen:
+            seen.add(key)
+            out.append(item)
+    return out[:limit]
+
+
+def legacy_gather_links(main, base_url):
+    links = []
+    for a in main.find_all("a", href=True):
+        text = app._collapse(a.get_text(" "))[:160]
+        href = urljoin(base_url, a["href"]) if a["href"] else None
+        if href and text:
+            links.append({"text": text, "url": href})
+    return _dedupe(links, app._PAGE_LINKS_MAX)
+
+
+def legacy_extract_nav_links(soup, base_url):
+    navs = []
+    for nav in soup.find_all(["nav"]):
+        for a in nav.find_all("a", href=True):
+            txt = app._collapse(a.get_text(" "))
+            href = urljoin(base_url, a["href"]) if a["href"] else None
+            if txt and href:
+                navs.append({"text": txt, "url": href})
+    return _dedupe(navs, 50)
+
+
+def legacy(soup, url):
+    main = legacy_select_main(soup)
+    headings = legacy_extract_headings(main)
+    chunks = legacy_build_chunks(headings, main)
+    return chunks, legacy_gather_links(main, url), legacy_extract_nav_links(soup, url)
+
+
+def indexed(soup, url):
+    index = app._index_dom(soup)
+    main = app._select_main(soup, index)
+    headings = app._extract_headings(main, index)
+    chunks = app._build_chunks(headings, main, index)
+    return chunks, app._gather_links(main, url, index), app._extract_nav_links(soup, url, index)
+
+
+def best_of(fn, soup, url, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(soup, url)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    url = "https://bench.example/page"
+    html = build_page(args.sections)
+    soup = app._make_soup(html)
+    if legacy(soup, url) != indexed(soup, url):
+        print("MISMATCH: indexed extraction differs from the legacy path")
+        return 1
+    t_legacy = best_of(legacy, soup, url, args.repeat)
+    t_indexed = best_of(indexed, soup, url, args.repeat)
+    print(f"page: {len(html)} bytes, {args.sections * 9} headings (parser={app._parser_backend()})")
+    print(f"legacy:  {t_legacy * 1000:8.1f} ms")
+    print(f"indexed: {t_indexed * 1000:8.1f} ms  ({t_legacy / t_indexed:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
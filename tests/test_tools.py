@@ -47,3 +47,101 @@ def test_ai_company_news():
     data = jrpc("tools/call", 6, {"name":"ai_company_news","arguments":{}})
     payload = json.loads(data['result']['content'][0]['text'])
     assert payload.get('companies')
+
+
+def test_sse_session_receives_response():
+    stream = requests.get(BASE, stream=True, timeout=20)
+    lines = stream.iter_lines(decode_unicode=True)
+    endpoint = next(line[len("data: "):] for line in lines if line.startswith("data: /mcp"))
+    post_url = BASE.rsplit("/mcp", 1)[0] + endpoint
+    r = requests.post(post_url, json={"jsonrpc":"2.0","id":7,"method":"tools/list"}, timeout=20)
+    assert r.status_code == 202
+    message = next(json.loads(line[len("data: "):]) for line in lines if line.startswith("data: {") and '"id": 7' in line)
+    stream.close()
+    assert message['id'] == 7
+    assert any(t['name'] == 'fetch_url' for t in message['result']['tools'])
+
+
+def test_batch_keeps_ids_and_skips_notifications():
+    batch = [
+        {"jsonrpc":"2.0","id":"a","method":"tools/list"},
+        {"jsonrpc":"2.0","method":"notifications/initialized"},
+        {"jsonrpc":"2.0","id":"b","method":"tools/call","params":{"name":"get_system_prompt","arguments":{}}},
+    ]
+    r = requests.post(BASE, json=batch, timeout=20)
+    r.raise_for_status()
+    responses = r.json()
+    assert [resp['id'] for resp in responses] == ["a", "b"]
+    assert all('result' in resp for resp in responses)
+    empty = requests.post(BASE, json=[], timeout=20).json()
+    assert empty['error']['code'] == -32600
+
+
+def test_metrics_count_tool_calls():
+    jrpc("tools/call", 8, {"name":"get_system_prompt","arguments":{}})
+    r = requests.get(BASE.rsplit("/mcp", 1)[0] + "/metrics", timeout=20)
+    r.raise_for_status()
+    assert r.headers["Content-Type"].startswith("text/plain")
+    assert 'webtool_tool_calls_total{status="ok",tool="get_system_prompt"}' in r.text
+    assert "# TYPE webtool_tool_duration_seconds histogram" in r.text
+
+
+def test_admin_profile_requires_token():
+    r = requests.post(BASE.rsplit("/mcp", 1)[0] + "/admin/profile?seconds=1", headers={"Authorization": "Bearer wrong"}, timeout=20)
+    assert r.status_code in (403, 404)
+
+
+def test_fetch_url_respects_max_tokens():
+    data = jrpc("tools/call", 9, {"name":"fetch_url","arguments":{"url":"https://example.com","max_tokens":200}})
+    text = data['result']['content'][0]['text']
+    assert 'Example Domain' in text
+    assert len(text) // 4 <= 200
+
+
+def test_fetch_url_links_cursor_paging():
+    data = jrpc("tools/call", 10, {"name":"fetch_url","arguments":{"url":"https://example.com","mode":"links"}})
+    text = data['result']['content'][0]['text']
+    assert 'next_cursor:' in text
+    bad = jrpc("tools/call", 11, {"name":"fetch_url","arguments":{"url":"https://example.com","cursor":"not-a-cursor"}})
+    assert 'malformed cursor' in bad['result']['content'][0]['text']
+
+
+def test_search_cache_is_offline_and_shaped():
+    data = jrpc("tools/call", 12, {"name":"search_cache","arguments":{"query":"example domain","max_results":3}})
+    payload = json.loads(data['result']['content'][0]['text'])
+    assert isinstance(payload.get('results'), list)
+    for hit in payload['results']:
+        assert {'url','chunk_id','snippet','score'} <= set(hit)
+
+
+def test_fetch_url_query_ranks_sections():
+    data = jrpc("tools/call", 13, {"name":"fetch_url","arguments":{"url":"https://example.com","query":"example domain","top_k":1}})
+    text = data['result']['content'][0]['text']
+    assert 'RANKED' in text
+    assert 'score:' in text
+
+
+def test_auto_parser_uses_lxml_when_equivalent():
+    health = requests.get(BASE.rsplit("/mcp", 1)[0] + "/health", timeout=20).json()["parser"]
+    lxml = health["selftest"].get("lxml", {})
+    if not lxml.get("available"):
+        pytest.skip("lxml not installed or parser self-test disabled")
+    assert lxml["equivalent"]
+    assert health["backend"] == "lxml"
+
+
+def _fetch_url_errors() -> float:
+    metrics = requests.get(BASE.rsplit("/mcp", 1)[0] + "/metrics", timeout=20).text
+    for line in metrics.splitlines():
+        if line.startswith("webtool_tool_calls_total{") and 'status="error"' in line and 'tool="fetch_url"' in line:
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_failed_link_follow_is_counted_as_error():
+    before = _fetch_url_errors()
+    data = jrpc("tools/call", 14, {"name":"fetch_url","arguments":{"url":"https://example.com","link_id":"L999"}})
+    result = data['result']
+    assert result.get('isError') is True
+    assert 'cache_status' not in result['content'][0]['text']
+    assert _fetch_url_errors() == before + 1